@@ -0,0 +1,118 @@
+"""Benchmark the write stage of an import: the original to_sql path against BulkLoader.
+
+Usage:
+
+    python benchmarks/bulk_load.py [--rows 500000] [--repeat 3]
+
+The rows look like what convert_import_chunk hands to the loader for a
+sheet with TEXT, CURRENCY, DATE, INTEGER and REAL columns, in chunks of
+IMPORT_CHUNK_SIZE rows. Every run writes into a fresh database in a
+temporary directory; the best of --repeat runs is reported. The last line
+copies the loaded rows within SQLite (INSERT ... SELECT): the engine's own
+share of the work, so the rest is binding the values through sqlite3.
+"""
+import argparse
+import os
+import shutil
+import sqlite3
+import sys
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+COLUMN_TYPES = {'Opportunity Name': 'TEXT', 'Amount': 'CURRENCY', 'Close Date': 'DATE', 'Stage': 'TEXT',
+                'Count': 'INTEGER', 'Probability': 'REAL', 'Notes': 'TEXT'}
+
+def make_rows(rows, seed=0):
+    """Converted import rows as convert_import_chunk returns them"""
+    rng = np.random.default_rng(seed)
+    amount = pd.array(rng.integers(0, 10 ** 7, rows), dtype='Int64')
+    amount[rng.random(rows) < 0.05] = pd.NA
+    close = pd.Timestamp('2020-01-01') + pd.to_timedelta(rng.integers(0, 3000, rows), unit='D')
+    notes = np.where(rng.random(rows) < 0.2, 'call back', None)
+    return pd.DataFrame({
+        'Opportunity Name': pd.Series([f'Opp {i} Acme' for i in range(rows)], dtype=object),
+        'Amount': amount,
+        'Close Date': pd.Series(close.strftime('%Y-%m-%d'), dtype=object),
+        'Stage': pd.Series(rng.choice(['Open', 'Qualified', 'Won', 'Lost'], rows), dtype=object),
+        'Count': pd.array(rng.integers(0, 100, rows), dtype='Int64'),
+        'Probability': rng.random(rows),
+        'Notes': pd.Series(notes, dtype=object)})
+
+def fresh_database(path, importer):
+    if os.path.exists(path):
+        os.remove(path)
+    conn = sqlite3.connect(path)
+    importer.ensure_table_columns(conn, 'opps', COLUMN_TYPES)
+    return conn
+
+def run_to_sql(conn, importer, chunks):
+    """The import path BulkLoader replaced: COUNT(*) before and after a to_sql append"""
+    before = conn.execute('SELECT COUNT(*) FROM opps').fetchone()[0]
+    pd.concat(chunks, ignore_index=True).to_sql('opps', conn, if_exists='append', index=False)
+    conn.commit()
+    return conn.execute('SELECT COUNT(*) FROM opps').fetchone()[0] - before
+
+def run_bulk_loader(conn, importer, chunks):
+    with importer.BulkLoader(conn, 'opps') as loader:
+        for chunk in chunks:
+            loader.insert(chunk)
+    return loader.rows_inserted
+
+def run_open_loader(conn, importer, chunks):
+    """BulkLoader as imports use it, keeping column statistics"""
+    with importer.open_loader(conn, 'opps', COLUMN_TYPES) as loader:
+        for chunk in chunks:
+            loader.insert(chunk)
+    return loader.rows_inserted
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmark to_sql against BulkLoader.')
+    parser.add_argument('--rows', type=int, default=500000)
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args(argv)
+
+    workdir = tempfile.mkdtemp()
+    # importxl_web keeps its caches in the working directory
+    os.chdir(workdir)
+    import importxl_web as importer
+    try:
+        df = make_rows(args.rows)
+        chunks = [df.iloc[start:start + importer.IMPORT_CHUNK_SIZE]
+                  for start in range(0, len(df), importer.IMPORT_CHUNK_SIZE)]
+        db_path = os.path.join(workdir, 'bench.db')
+        results = {}
+        for name, run in (('to_sql (before)', run_to_sql), ('BulkLoader', run_bulk_loader),
+                          ('BulkLoader + statistics', run_open_loader)):
+            best = None
+            for _ in range(args.repeat):
+                conn = fresh_database(db_path, importer)
+                started = time.perf_counter()
+                rows = run(conn, importer, chunks)
+                elapsed = time.perf_counter() - started
+                conn.close()
+                assert rows == args.rows, (name, rows)
+                best = elapsed if best is None else min(best, elapsed)
+            results[name] = best
+        conn = sqlite3.connect(db_path)
+        conn.execute('CREATE TABLE opps_copy AS SELECT * FROM opps WHERE 0')
+        started = time.perf_counter()
+        conn.execute('INSERT INTO opps_copy SELECT * FROM opps')
+        conn.commit()
+        results['SQLite alone'] = time.perf_counter() - started
+        conn.close()
+        baseline = results['to_sql (before)']
+        print(f'{args.rows} rows, {len(COLUMN_TYPES)} columns, best of {args.repeat}')
+        for name, elapsed in results.items():
+            print(f'{name:25} {elapsed:7.2f}s {args.rows / elapsed:>10,.0f} rows/s {baseline / elapsed:6.2f}x')
+    finally:
+        os.chdir(os.path.dirname(workdir))
+        shutil.rmtree(workdir, ignore_errors=True)
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
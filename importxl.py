@@ -1,77 +1,204 @@
-import pandas as pd
+"""Headless batch import of Excel files into SQLite using a saved mapping profile.
+
+Profiles are saved from the web interface ("Save this mapping as a profile")
+into config/profiles/. Example nightly run:
+
+    python importxl.py Data/ --db Data/funnel.db --profile opportunities
+
+Files are parsed in parallel worker processes into the parsed-sheet cache
+while the main process is the only one writing to the database: it streams
+each file's rows from the cache and loads them in one transaction per file.
+"""
+import argparse
+import glob
+import json
+import multiprocessing
+import os
 import sqlite3
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
 
-# Path to your Excel file
-excel_file = '/Users/niels/Python/Funnel14/Data/HIMT US Opportunities-2025-07-10-10-00-02.xlsx'
-# Name of the SQLite database file
-db_file = 'my_database.db'
-# Name of the table to insert data into
-table_name = 'my_table'
+from importxl_web import (SQLITE_TIMEOUT, IMPORT_CHUNK_SIZE, apply_mapping_profile, ensure_table_columns,
+                          find_import, import_ledger_key, iter_excel_chunks, iter_import_chunks,
+                          list_excel_sheets, load_mapping_profile, loader_summary, open_loader,
+                          record_import, sheet_cache_path, store_column_metadata)
 
-# Read Excel file (first sheet)
-df = pd.read_excel(excel_file, sheet_name=0)
+def find_excel_files(paths):
+    """Expand directories and glob patterns into a sorted list of .xlsx files"""
+    files = []
+    for path in paths:
+        if os.path.isdir(path):
+            matches = glob.glob(os.path.join(path, '*.xlsx'))
+        else:
+            matches = glob.glob(path)
+        # Skip the lock files Excel leaves next to open workbooks
+        files.extend(m for m in matches if not os.path.basename(m).startswith('~$'))
+    return sorted(set(files))
 
-# Connect to SQLite database (it will be created if it doesn't exist)
-conn = sqlite3.connect(db_file)
-cursor = conn.cursor()
+def parse_file(excel_path, profile, sheets, company=None):
+    """Worker: parse the selected sheets of one file into the parsed-sheet cache and map their columns.
 
-# Get existing columns from the table
-def refresh_table_columns():
-    cursor.execute(f'PRAGMA table_info({table_name})')
-    table_info = cursor.fetchall()
-    return [col[1] for col in table_info]
+    Returns the mapping and column types of every sheet and the Excel columns
+    the profile did not map, but no rows: the writer streams those from the
+    cache chunk by chunk, parsing a sheet again itself if its entry was evicted.
+    """
+    if sheets == ['all']:
+        sheet_names = list_excel_sheets(excel_path)
+    else:
+        sheet_names = sheets or [0]
+    parsed_sheets = []
+    column_types = {}
+    unmapped = []
+    for sheet_name in sheet_names:
+        cached = os.path.exists(sheet_cache_path(excel_path, sheet_name))
+        mapping = None
+        chunks = iter_excel_chunks(excel_path, sheet_name=sheet_name, chunk_size=IMPORT_CHUNK_SIZE)
+        for chunk in chunks:
+            if mapping is None:
+                mapping, sheet_types, sheet_unmapped = apply_mapping_profile(profile, list(chunk.columns))
+                if company:
+                    mapping['LAB14COMPANY'] = profile['columns'].get('LAB14COMPANY', {}).get('target', 'LAB14COMPANY')
+                    sheet_types.setdefault(mapping['LAB14COMPANY'], 'TEXT')
+                column_types.update(sheet_types)
+                unmapped.extend(col for col in sheet_unmapped if col not in unmapped)
+            if cached:
+                break  # The header is all that is needed from a sheet already in the cache
+        chunks.close()
+        parsed_sheets.append((sheet_name, mapping, sheet_types))
+    return {'file': excel_path, 'sheets': parsed_sheets, 'column_types': column_types, 'unmapped': unmapped}
 
-table_columns = refresh_table_columns()
+def write_file(conn, table, parsed, mode='append', key_columns=None, ledger_key=None, company=None):
+    """Writer: load one parsed file into table in a single transaction, recording it in the import ledger"""
+    warnings = ensure_table_columns(conn, table, parsed['column_types'])
+    with open_loader(conn, table, parsed['column_types'], mode, key_columns) as loader:
+        for sheet_name, mapping, sheet_types in parsed['sheets']:
+            for chunk in iter_import_chunks(parsed['file'], sheet_name, mapping, sheet_types, company):
+                loader.insert(chunk)
+        if ledger_key:
+            record_import(conn, table, ledger_key, loader.rows_processed)
+    store_column_metadata(conn, table, parsed['column_types'])
+    return loader, warnings
 
-# Check for missing columns
-new_df = df.copy()
-for col in df.columns:
-    if col not in table_columns:
-        print(f"Column '{col}' not found in table '{table_name}'.")
-        print("Select a column to map to, 0 to skip, or 'n' to create a new column:")
-        for idx, tcol in enumerate(table_columns, 1):
-            print(f"{idx}: {tcol}")
-        while True:
-            selection = input(f"Enter number for mapping '{col}', 0 to skip, or 'n' to create new column: ").strip()
-            if selection == '0':
-                new_df = new_df.drop(columns=[col])
-                break
-            elif selection.lower() == 'n':
-                # Infer SQLite type from pandas dtype
-                dtype = new_df[col].dtype
-                if pd.api.types.is_integer_dtype(dtype):
-                    sqltype = 'INTEGER'
-                elif pd.api.types.is_float_dtype(dtype):
-                    sqltype = 'REAL'
-                elif pd.api.types.is_bool_dtype(dtype):
-                    sqltype = 'BOOLEAN'
-                else:
-                    sqltype = 'TEXT'
-                try:
-                    cursor.execute(f'ALTER TABLE {table_name} ADD COLUMN "{col}" {sqltype}')
-                    conn.commit()
-                    print(f"Added column '{col}' of type {sqltype} to table '{table_name}'.")
-                    table_columns = refresh_table_columns()
-                except Exception as e:
-                    print(f"Failed to add column: {e}")
-                    new_df = new_df.drop(columns=[col])
-                break
-            else:
-                try:
-                    idx = int(selection)
-                    if 1 <= idx <= len(table_columns):
-                        new_df = new_df.rename(columns={col: table_columns[idx-1]})
-                        break
-                    else:
-                        print("Invalid selection. Try again.")
-                except ValueError:
-                    print("Please enter a valid number or 'n'.")
+def skipped_result(excel_path, started, previous):
+    """Summary entry of a file whose content was already imported with this profile"""
+    return {'file': excel_path, 'sheets': 0, 'rows': 0, 'status': 'skipped', 'unmapped': [], 'warnings': [],
+            'error': None, 'seconds': round(time.time() - started, 2),
+            'written': f"already imported on {previous['imported_at']}"}
 
-# Only keep columns that exist in the table
-new_df = new_df[[c for c in new_df.columns if c in table_columns]]
+def report(summary, result):
+    """Add the result of one file to the summary and print it"""
+    summary.append(result)
+    print(f"{result['status']:7} {result['rows']:>8} rows {result['sheets']:>3} sheets "
+          f"{result['seconds']:>7.2f}s  {os.path.basename(result['file'])}")
+    if result.get('written'):
+        print(f"          {result['written']}")
+    if result['unmapped']:
+        print(f"          skipped unmapped columns: {', '.join(result['unmapped'])}")
+    for warning in result['warnings']:
+        print(f'          warning: {warning}')
+    if result['error']:
+        print(f"          error: {result['error']}")
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Import Excel files into SQLite with a saved mapping profile.')
+    parser.add_argument('paths', nargs='+', help='Excel files, directories or glob patterns')
+    parser.add_argument('--db', required=True, help='SQLite database file (created if missing)')
+    parser.add_argument('--profile', required=True, help='Mapping profile name or path to a profile JSON file')
+    parser.add_argument('--table', help='Target table (default: the table the profile was saved for)')
+    parser.add_argument('--company', help='Fill LAB14COMPANY with this company for every row')
+    parser.add_argument('--sheet', action='append', help="Sheet to import, repeatable, or 'all' (default: first sheet)")
+    mode = parser.add_mutually_exclusive_group()
+    mode.add_argument('--incremental', action='store_true',
+                      help='Only insert rows that are new or changed since earlier imports')
+    mode.add_argument('--replace', action='store_true',
+                      help='Replace all rows of the table with those of the file (only one file allowed)')
+    parser.add_argument('--key', action='append', help='Key column for --incremental, repeatable; '
+                        'rows with a known key update the existing row')
+    parser.add_argument('--force', action='store_true',
+                        help='Import files even if they were already imported with this profile')
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 2, help='Number of parsing processes')
+    parser.add_argument('--summary-json', help='Also write the per-file summary to this JSON file')
+    args = parser.parse_args(argv)
+
+    import_mode = 'incremental' if args.incremental else 'replace' if args.replace else 'append'
+    profile = load_mapping_profile(args.profile)
+    table = args.table or profile['table']
+    files = find_excel_files(args.paths)
+    if not files:
+        print('No Excel files found.')
+        return 1
+    if args.replace and len(files) > 1:
+        # Every file would be swapped in on its own and only the last one written would remain
+        parser.error(f'--replace takes a single file, the paths match {len(files)} files')
+
+    print(f'Importing {len(files)} files into table "{table}" of {args.db} with {args.workers} workers')
+    started = time.time()
+    summary = []
+    conn = sqlite3.connect(args.db, timeout=SQLITE_TIMEOUT)
+    try:
+        with ProcessPoolExecutor(max_workers=args.workers) as pool:
+            # Parse only a few files ahead of the writer, so their cache entries are still there when it gets to them
+            max_pending = args.workers * 2
+            pending = {}
+            remaining = iter(files)
+            while True:
+                for excel_path in remaining:
+                    started_file = time.time()
+                    try:
+                        # Files already imported with this profile only cost a hash of their content
+                        ledger_key = import_ledger_key(excel_path, args.sheet or [0],
+                                                       {'profile': profile['columns'], 'company': args.company})
+                        previous = None if args.force else find_import(conn, table, ledger_key)
+                    except OSError:
+                        # Unreadable files are reported by the worker that tries to parse them
+                        ledger_key, previous = None, None
+                    if previous:
+                        report(summary, skipped_result(excel_path, started_file, previous))
+                        continue
+                    future = pool.submit(parse_file, excel_path, profile, args.sheet, args.company)
+                    pending[future] = (excel_path, started_file, ledger_key)
+                    if len(pending) >= max_pending:
+                        break
+                if not pending:
+                    break
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    excel_path, submitted, ledger_key = pending.pop(future)
+                    # A file with the same content may have been written since this one was submitted
+                    previous = None if args.force or not ledger_key else find_import(conn, table, ledger_key)
+                    if previous:
+                        report(summary, skipped_result(excel_path, submitted, previous))
+                        continue
+                    result = {'file': excel_path, 'sheets': 0, 'rows': 0, 'status': 'ok',
+                              'unmapped': [], 'warnings': [], 'error': None}
+                    try:
+                        parsed = future.result()
+                        result['sheets'] = len(parsed['sheets'])
+                        result['unmapped'] = parsed['unmapped']
+                        loader, result['warnings'] = write_file(conn, table, parsed, import_mode,
+                                                                args.key, ledger_key, args.company)
+                        result['rows'] = loader.rows_inserted
+                        if args.incremental:
+                            result['written'] = loader_summary(loader)
+                    except Exception as e:
+                        result['status'] = 'failed'
+                        result['error'] = str(e)
+                    result['seconds'] = round(time.time() - submitted, 2)
+                    report(summary, result)
+    finally:
+        conn.close()
 
-# Write the data to the database
-new_df.to_sql(table_name, conn, if_exists='append', index=False)
+    failed = [r for r in summary if r['status'] == 'failed']
+    skipped = [r for r in summary if r['status'] == 'skipped']
+    total_rows = sum(r['rows'] for r in summary)
+    print(f'Done: {len(summary) - len(failed) - len(skipped)} files imported, {len(skipped)} already imported, '
+          f'{len(failed)} failed, {total_rows} rows in {time.time() - started:.1f}s')
+    if args.summary_json:
+        with open(args.summary_json, 'w') as f:
+            json.dump(summary, f, indent=2)
+    return 1 if failed else 0
 
-conn.close()
-print(f"Data from {excel_file} added to {table_name} in {db_file}")
\ No newline at end of file
+if __name__ == '__main__':
+    multiprocessing.freeze_support()
+    sys.exit(main())
@@ -1,11 +1,35 @@
-from flask import Flask, render_template_string, request, redirect, url_for, send_from_directory, send_file, session
+from flask import Flask, render_template_string, request, redirect, url_for, send_from_directory, send_file, session, jsonify, Response, stream_with_context
 import os
 import sqlite3
 import pandas as pd
+import numpy as np
 import io
 import datetime
 import urllib.parse
 import json
+import hashlib
+import pickle
+import threading
+import time
+import traceback
+import uuid
+import multiprocessing
+import sys
+import atexit
+import re
+import itertools
+import base64
+import gzip
+import shutil
+import tempfile
+import csv
+import zlib
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from openpyxl import load_workbook
+from werkzeug.utils import secure_filename
+from werkzeug.wsgi import ClosingIterator
 
 app = Flask(__name__)
 app.secret_key = 'your-secret-key-here'
@@ -15,11 +39,132 @@ DATA_DIR = 'Data'
 DB_EXT = '.db'
 UPLOAD_DB_DIR = 'Data'
 COMPANY_CHOICES = ['HIMT', 'SPECSGROUP', 'NANOSURF', 'NANOSCRIBE', 'NOTION SYSTEMS', 'GENISYS', '40-30', 'AMCOSS', 'MUTO TECHNOLOGIES']
+# Rows read, converted and inserted per step when streaming an Excel sheet
+IMPORT_CHUNK_SIZE = 5000
+# Rows read from the top of a sheet to build the column mapping page
+PREVIEW_ROWS = 1000
+# Rows sampled, evenly spread over the whole sheet, to predict column types
+INFERENCE_SAMPLE_ROWS = 200
+# Column name fragments that make a column a DATE (if its values parse as dates) or CURRENCY candidate
+DATE_KEYWORDS = ['date', 'time', 'created', 'modified', 'updated', 'start', 'end', 'due', 'deadline', 'birth',
+                 'anniversary', 'expiry', 'valid', 'period', 'datum', 'erstellt', 'geändert', 'schluss', 'phase']
+CURRENCY_KEYWORDS = ['price', 'cost', 'amount', 'value', 'revenue', 'sales', 'budget', 'fee', 'charge', 'payment',
+                     'total', 'sum', 'money', 'dollar', 'euro', 'currency', 'cash', 'income', 'expense', 'profit',
+                     'loss', 'betrag', 'preis', 'kosten', 'umsatz']
+# Rows bound per executemany call by the bulk loader
+INSERT_BATCH_SIZE = 10000
+# Parameters bound per INSERT statement, several rows each; 999 is the limit of SQLite before 3.32
+INSERT_MAX_PARAMETERS = 999
+# Connection pragmas used while bulk loading; previous values are restored afterwards.
+# Only per-connection settings belong here: journal_mode would rewrite the user's database file.
+IMPORT_PRAGMAS = {'synchronous': 'NORMAL', 'cache_size': -65536}
+# Seconds an import waits for a database locked by another connection
+SQLITE_TIMEOUT = 60
+# Journal mode the web app sets on the databases it writes to, or None to leave them as they are.
+# In WAL mode pages keep reading while an import runs; in the default rollback mode a long import
+# locks readers out until it commits. The mode is stored in the database file (which then has
+# -wal/-shm files next to it); database downloads are always converted back to a single file.
+WEB_JOURNAL_MODE = 'WAL'
+# Imports run on a bounded worker pool so requests return immediately
+IMPORT_WORKERS = 4
+MAX_ACTIVE_JOBS = 16
+MAX_FINISHED_JOBS = 100
+# Worker processes parsing sheets concurrently when several sheets are imported at once
+PARSE_PROCESSES = os.cpu_count() or 2
+# Seconds an import waits for the pool to parse one sheet, queueing included, before the import fails
+PARSE_TIMEOUT = 600
+# Sort orders requested this often on view_table get an index, at most AUTO_INDEX_MAX_PER_TABLE per table
+AUTO_INDEX_THRESHOLD = 3
+AUTO_INDEX_MAX_PER_TABLE = 5
+# Rows fetched from SQLite and written per step by the streaming exports
+EXPORT_CHUNK_SIZE = 5000
+# Database downloads are consistent snapshots copied with the backup API this many pages per step
+BACKUP_PAGES_PER_STEP = 1024
+# Restarts caused by writes during a database snapshot before it is copied in one step instead
+BACKUP_MAX_RESTARTS = 3
+# Data rows per worksheet of an Excel export; Excel stops at 1,048,576 rows including the header
+EXCEL_MAX_ROWS = 1048575
+# Rows per row group of a Parquet export
+PARQUET_ROW_GROUP_ROWS = 100000
+# Registers of the distinct count sketch kept per column are 2**HLL_PRECISION bytes (about 1.6% error)
+HLL_PRECISION = 12
+# Rows per page offered on view_table
+VIEW_PAGE_SIZES = [20, 50, 100, 500]
+# Filter operators offered on view_table, with the SQL comparison used for the first six
+FILTER_OPERATORS = {'eq': '=', 'ne': '!=', 'lt': '<', 'le': '<=', 'gt': '>', 'ge': '>=',
+                    'contains': 'contains', 'empty': 'is empty', 'notempty': 'is not empty'}
+# Filtered row counts and keyset cursors kept per database version by the table data endpoint
+VIEW_CACHE_ENTRIES = 256
+# Memory used by pages of rows kept by the result cache for view_table and table_data
+RESULT_CACHE_MAX_BYTES = 64 * 1024 * 1024
+# Text date formats tried when detecting the format of a DATE column, German first
+DATE_FORMATS = ['%d.%m.%Y', '%Y-%m-%d', '%m/%d/%Y', '%d/%m/%Y', '%d.%m.%y', '%m/%d/%y',
+                '%d.%m.%Y %H:%M', '%d.%m.%Y %H:%M:%S', '%Y-%m-%d %H:%M:%S', '%Y-%m-%dT%H:%M:%S',
+                '%m/%d/%Y %H:%M', '%m/%d/%Y %H:%M:%S']
+# Text values used to detect the format of a date column
+DATE_SAMPLE_SIZE = 200
+# Excel serial dates count days from 1899-12-30; numbers outside 1900-01-01..9999-12-31 are not dates
+EXCEL_EPOCH = '1899-12-30'
+EXCEL_SERIAL_MAX = 2958465
 
 # Create config directory for storing user preferences
 CONFIG_DIR = 'config'
 if not os.path.exists(CONFIG_DIR):
     os.makedirs(CONFIG_DIR)
+# Saved column mapping profiles used by the headless batch importer (importxl.py)
+PROFILES_DIR = os.path.join(CONFIG_DIR, 'profiles')
+
+# Parsed Excel sheets are cached here so the same workbook is not parsed on every request
+EXCEL_CACHE_DIR = 'cache'
+EXCEL_CACHE_MAX_BYTES = 1024 * 1024 * 1024
+# Database snapshots being downloaded, kept until the database changes so downloads can resume;
+# they count towards EXCEL_CACHE_MAX_BYTES with the parsed sheets
+SNAPSHOT_DIR = os.path.join(EXCEL_CACHE_DIR, 'snapshots')
+if not os.path.exists(EXCEL_CACHE_DIR):
+    os.makedirs(EXCEL_CACHE_DIR)
+_excel_cache_lock = threading.Lock()
+_sheet_names_cache = {}
+_file_hash_cache = {}
+
+_import_executor = ThreadPoolExecutor(max_workers=IMPORT_WORKERS, thread_name_prefix='import')
+_jobs = {}
+_jobs_lock = threading.Lock()
+_db_write_locks = {}
+_parse_pool = None
+
+# User type choices are served from memory; stored choices are written in batches by flush_user_type_choices()
+USER_TYPE_CHOICES_RECHECK_SECONDS = 2
+_user_type_choices = None
+_user_type_choices_loaded_mtime = None
+_user_type_choices_checked = 0
+_pending_user_type_choices = []
+_user_type_choices_lock = threading.Lock()
+
+# One read-only connection per database whose PRAGMA data_version tells when the database changed
+_db_monitors = {}
+_db_monitors_lock = threading.Lock()
+_metadata_cache = {}
+_metadata_cache_lock = threading.Lock()
+
+# Index advisor: {(database, table, sort key): requests since start} and the sort keys being indexed
+_sort_hits = {}
+_sort_hits_lock = threading.Lock()
+_auto_indexes_pending = set()
+# Row counts of tables, keyed by db_state_token so they are dropped when the database changes
+_row_count_cache = {}
+_row_count_cache_lock = threading.Lock()
+# Keyset cursors of pages the table data endpoint served: {(db_state_token, table, order, filter, start): cursor}
+_page_cursor_cache = {}
+_page_cursor_cache_lock = threading.Lock()
+# Result cache, least recently used first: {(database, table, query key): (db_state_token, value, bytes)}
+_result_cache = OrderedDict()
+_result_cache_bytes = 0
+_result_cache_stats = {'hits': 0, 'misses': 0, 'evictions': 0, 'invalidations': 0}
+_result_cache_lock = threading.Lock()
+# Serializes taking database snapshots for download
+_snapshot_lock = threading.Lock()
+# Snapshots being created or downloaded, {path: number of users}; the cache limit never evicts them
+_snapshots_in_use = {}
 
 def get_user_type_choices_file():
     """Get the path to the user type choices file"""
@@ -37,19 +182,23 @@ def load_user_type_choices():
     return {}
 
 def save_user_type_choices(choices):
-    """Save user type choices to JSON file"""
+    """Save user type choices to JSON file, replacing it atomically"""
     file_path = get_user_type_choices_file()
+    tmp_path = f'{file_path}.{os.getpid()}.tmp'
     try:
-        with open(file_path, 'w') as f:
+        with open(tmp_path, 'w') as f:
             json.dump(choices, f, indent=2)
+        os.replace(tmp_path, file_path)
     except IOError:
         pass  # Silently fail if we can't write the file
 
-def store_user_type_choice(column_name, chosen_type):
-    """Store user's preferred type for a column"""
-    choices = load_user_type_choices()
-    now = datetime.datetime.now().isoformat()
-    
+def _user_type_choices_mtime():
+    try:
+        return os.stat(get_user_type_choices_file()).st_mtime_ns
+    except OSError:
+        return None
+
+def _apply_user_type_choice(choices, column_name, chosen_type, now):
     if column_name in choices:
         choices[column_name]['chosen_type'] = chosen_type
         choices[column_name]['count'] = choices[column_name].get('count', 0) + 1
@@ -60,16 +209,105 @@ def store_user_type_choice(column_name, chosen_type):
             'count': 1,
             'last_used': now
         }
-    
-    save_user_type_choices(choices)
+
+def _current_user_type_choices():
+    """The in-memory choices, reloaded when another process changed the file (call with the lock held)"""
+    global _user_type_choices, _user_type_choices_loaded_mtime, _user_type_choices_checked
+    now = time.monotonic()
+    if _user_type_choices is None or now - _user_type_choices_checked >= USER_TYPE_CHOICES_RECHECK_SECONDS:
+        _user_type_choices_checked = now
+        mtime = _user_type_choices_mtime()
+        if _user_type_choices is None or mtime != _user_type_choices_loaded_mtime:
+            choices = load_user_type_choices()
+            # Choices not flushed yet stay on top of what is on disk
+            for column_name, chosen_type, used in _pending_user_type_choices:
+                _apply_user_type_choice(choices, column_name, chosen_type, used)
+            _user_type_choices = choices
+            _user_type_choices_loaded_mtime = mtime
+    return _user_type_choices
+
+def store_user_type_choice(column_name, chosen_type):
+    """Store user's preferred type for a column; call flush_user_type_choices() to persist it"""
+    now = datetime.datetime.now().isoformat()
+    with _user_type_choices_lock:
+        _apply_user_type_choice(_current_user_type_choices(), column_name, chosen_type, now)
+        _pending_user_type_choices.append((column_name, chosen_type, now))
+
+def flush_user_type_choices():
+    """Write stored choices to the choices file in one atomic update.
+
+    The file is read again first so choices saved by other processes in
+    the meantime are kept.
+    """
+    global _user_type_choices, _user_type_choices_loaded_mtime
+    with _user_type_choices_lock:
+        if not _pending_user_type_choices:
+            return
+        choices = load_user_type_choices()
+        for column_name, chosen_type, used in _pending_user_type_choices:
+            _apply_user_type_choice(choices, column_name, chosen_type, used)
+        save_user_type_choices(choices)
+        _pending_user_type_choices.clear()
+        _user_type_choices = choices
+        _user_type_choices_loaded_mtime = _user_type_choices_mtime()
 
 def get_user_type_choice(column_name):
     """Get user's preferred type for a column"""
-    choices = load_user_type_choices()
-    if column_name in choices:
-        return choices[column_name]['chosen_type']
+    with _user_type_choices_lock:
+        choice = _current_user_type_choices().get(column_name)
+    if choice:
+        return choice['chosen_type']
     return None
 
+# Don't lose choices stored after the last flush when the app stops
+atexit.register(flush_user_type_choices)
+
+def get_profile_path(name):
+    """Get the path of a saved mapping profile"""
+    return os.path.join(PROFILES_DIR, secure_filename(name) + '.json')
+
+def save_mapping_profile(name, table, sheet_mappings, column_types):
+    """Save the mapping chosen on the form as a profile for headless batch imports"""
+    columns = {}
+    for _, mapping in sheet_mappings:
+        for excel_col, target in mapping.items():
+            columns.setdefault(excel_col, {'target': target, 'type': column_types.get(target, 'TEXT')})
+    profile = {
+        'table': table,
+        'columns': columns,
+        'saved': datetime.datetime.now().isoformat()
+    }
+    if not os.path.exists(PROFILES_DIR):
+        os.makedirs(PROFILES_DIR)
+    file_path = get_profile_path(name)
+    with open(file_path, 'w') as f:
+        json.dump(profile, f, indent=2)
+    return file_path
+
+def load_mapping_profile(name_or_path):
+    """Load a mapping profile given its file path or the name it was saved under"""
+    file_path = name_or_path if os.path.exists(name_or_path) else get_profile_path(name_or_path)
+    with open(file_path, 'r') as f:
+        return json.load(f)
+
+def apply_mapping_profile(profile, excel_columns):
+    """Map one sheet's columns with a profile.
+
+    Returns {excel column: table column}, {table column: type} and the Excel
+    columns the profile does not know about (those are skipped).
+    """
+    mapping = {}
+    column_types = {}
+    unmapped = []
+    for col in excel_columns:
+        entry = profile['columns'].get(col)
+        if entry is None:
+            unmapped.append(col)
+            continue
+        mapping[col] = entry['target']
+        column_types[entry['target']] = entry.get('type', 'TEXT')
+    return mapping, column_types, unmapped
+
 STYLE = '''
 <style>
 @import url('https://fonts.googleapis.com/css2?family=Sora:wght@400;600;700&display=swap');
@@ -223,10 +461,7 @@ def infer_sqltype(dtype):
     else:
         return 'TEXT'
 
-def create_metadata_table(conn, table_name):
-    """Create a metadata table to track column types"""
-    cur = conn.cursor()
-    cur.execute('''
+_METADATA_TABLE_SQL = '''
         CREATE TABLE IF NOT EXISTS column_metadata (
             table_name TEXT,
             column_name TEXT,
@@ -235,92 +470,1601 @@ def create_metadata_table(conn, table_name):
             is_date INTEGER DEFAULT 0,
             PRIMARY KEY (table_name, column_name)
         )
-    ''')
-    conn.commit()
+    '''
 
 def store_column_metadata(conn, table_name, column_types):
-    """Store column type information in metadata table"""
-    cur = conn.cursor()
-    create_metadata_table(conn, table_name)
-    
-    for col, col_type in column_types.items():
-        is_currency = 1 if col_type == 'CURRENCY' else 0
-        is_date = 1 if col_type == 'DATE' else 0
-        cur.execute('''
+    """Store column type information in metadata table, all columns in one transaction"""
+    rows = [(table_name, col, col_type, 1 if col_type == 'CURRENCY' else 0, 1 if col_type == 'DATE' else 0)
+            for col, col_type in column_types.items()]
+    conn.execute(_METADATA_TABLE_SQL)
+    with conn:
+        conn.executemany('''
             INSERT OR REPLACE INTO column_metadata (table_name, column_name, data_type, is_currency, is_date)
             VALUES (?, ?, ?, ?, ?)
-        ''', (table_name, col, col_type, is_currency, is_date))
-    conn.commit()
+        ''', rows)
+
+def db_state_token(db_path):
+    """A value that changes whenever anything is committed to the database at db_path.
+
+    Caches of query results keyed by this token never serve stale data. It
+    combines the file identity with PRAGMA data_version of a monitor
+    connection that never writes, so commits from any connection or process
+    change it. data_version only counts from when the monitor was opened,
+    so it comes paired with an id of the monitor. Returns None if the
+    database does not exist.
+    """
+    db_path = os.path.abspath(db_path)
+    try:
+        stat = os.stat(db_path)
+    except OSError:
+        return None
+    file_id = (stat.st_ino, stat.st_size, stat.st_mtime_ns)
+    with _db_monitors_lock:
+        monitor = _db_monitors.get(db_path)
+        if monitor is not None and monitor[0] != stat.st_ino:
+            # The database file was replaced, the old connection still sees the old file
+            monitor[1].close()
+            monitor = None
+        if monitor is None:
+            monitor = (stat.st_ino, sqlite3.connect(db_path, check_same_thread=False), uuid.uuid4().hex)
+            _db_monitors[db_path] = monitor
+        data_version = (monitor[2], monitor[1].execute('PRAGMA data_version').fetchone()[0])
+    return (db_path, file_id, data_version)
+
+def get_all_column_metadata(conn):
+    """Get column metadata for all tables as {table: {column: metadata}} in one query.
+
+    Results are cached per database and reused until db_state_token changes.
+    """
+    db_path = conn.execute('PRAGMA database_list').fetchone()[2]
+    token = db_state_token(db_path) if db_path else None
+    if token is not None:
+        with _metadata_cache_lock:
+            cached = _metadata_cache.get(token[0])
+        if cached and cached[0] == token:
+            return cached[1]
+    metadata = {}
+    try:
+        rows = conn.execute('''
+            SELECT table_name, column_name, data_type, is_currency, is_date
+            FROM column_metadata
+        ''').fetchall()
+    except sqlite3.OperationalError:
+        rows = []  # No metadata table yet
+    for table_name, column_name, data_type, is_currency, is_date in rows:
+        metadata.setdefault(table_name, {})[column_name] = {
+            'type': data_type, 'is_currency': bool(is_currency), 'is_date': bool(is_date)}
+    if token is not None:
+        with _metadata_cache_lock:
+            _metadata_cache[token[0]] = (token, metadata)
+    return metadata
 
 def get_column_metadata(conn, table_name):
     """Get column metadata for a table"""
-    cur = conn.cursor()
-    cur.execute('''
-        SELECT column_name, data_type, is_currency, is_date 
-        FROM column_metadata 
-        WHERE table_name = ?
-    ''', (table_name,))
-    return {row[0]: {'type': row[1], 'is_currency': bool(row[2]), 'is_date': bool(row[3])} for row in cur.fetchall()}
-
-def _predict_column_type_base(df, column_name):
-    """Predict if a column is currency or date based on content analysis"""
-    col_data = df[column_name].dropna()
-    if len(col_data) == 0:
+    return dict(get_all_column_metadata(conn).get(table_name, {}))
+
+def excel_header_names(header_row):
+    """Turn the first worksheet row into column names the way pd.read_excel does"""
+    # Trailing cells without a header carry no importable data
+    width = len(header_row)
+    while width and header_row[width - 1] is None:
+        width -= 1
+    names = []
+    seen = {}
+    for idx, value in enumerate(header_row[:width]):
+        name = f'Unnamed: {idx}' if value is None else str(value)
+        # Mangle duplicates as pandas does: "Name", "Name.1", "Name.2", ...
+        if name in seen:
+            seen[name] += 1
+            name = f'{name}.{seen[name]}'
+        seen.setdefault(name, 0)
+        names.append(name)
+    return names
+
+def parse_excel_chunks(excel_path, sheet_name=0, chunk_size=IMPORT_CHUNK_SIZE):
+    """Stream a worksheet as DataFrames of at most chunk_size rows.
+
+    Cells are read with openpyxl's read-only row iterator and kept as object
+    columns, so every chunk carries the raw cell values regardless of what the
+    other chunks contain. Completely empty rows are skipped.
+    """
+    wb = load_workbook(excel_path, read_only=True, data_only=True)
+    try:
+        ws = wb.worksheets[sheet_name] if isinstance(sheet_name, int) else wb[sheet_name]
+        rows = ws.iter_rows(values_only=True)
+        columns = excel_header_names(list(next(rows, ())))
+        width = len(columns)
+        batch = []
+        yielded = False
+        for row in rows:
+            row = row[:width]
+            if all(value is None for value in row):
+                continue
+            if len(row) < width:
+                row = row + (None,) * (width - len(row))
+            batch.append(row)
+            if len(batch) >= chunk_size:
+                yield pd.DataFrame(batch, columns=columns, dtype=object)
+                yielded = True
+                batch = []
+        # Header-only sheets still yield one empty frame to expose the columns
+        if batch or not yielded:
+            yield pd.DataFrame(batch, columns=columns, dtype=object)
+    finally:
+        wb.close()
+
+def file_fingerprint(path):
+    """Identify the current version of a file by absolute path, size and mtime"""
+    st = os.stat(path)
+    return (os.path.abspath(path), st.st_size, st.st_mtime_ns)
+
+def file_sha256(path):
+    """SHA-256 of a file's content, computed once per file version"""
+    fingerprint = file_fingerprint(path)
+    with _excel_cache_lock:
+        if fingerprint in _file_hash_cache:
+            return _file_hash_cache[fingerprint]
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(block)
+    with _excel_cache_lock:
+        _file_hash_cache[fingerprint] = digest.hexdigest()
+    return digest.hexdigest()
+
+def sheet_cache_path(excel_path, sheet_name, kind='sheet'):
+    """Get the sidecar path caching a parsed sheet of the current version of excel_path.
+
+    Entries cached for older versions of the same workbook are removed here, so a
+    re-uploaded or re-exported file never serves stale rows.
+    """
+    abs_path, size, mtime_ns = file_fingerprint(excel_path)
+    source_key = hashlib.sha1(abs_path.encode('utf-8')).hexdigest()[:16]
+    version = f'{size}-{mtime_ns}'
+    sheet_key = hashlib.sha1(str(sheet_name).encode('utf-8')).hexdigest()[:8]
+    file_name = f'{source_key}-{version}-{sheet_key}.{kind}.pkl'
+    try:
+        for entry in os.listdir(EXCEL_CACHE_DIR):
+            if entry.startswith(source_key + '-') and not entry.startswith(f'{source_key}-{version}-'):
+                os.remove(os.path.join(EXCEL_CACHE_DIR, entry))
+    except OSError:
+        pass
+    return os.path.join(EXCEL_CACHE_DIR, file_name)
+
+def read_cache_entry(cache_path):
+    """Yield the DataFrames pickled one after another into a cache sidecar"""
+    try:
+        # Refresh the mtime so LRU eviction sees this entry as recently used
+        os.utime(cache_path)
+    except OSError:
+        pass
+    with open(cache_path, 'rb') as f:
+        while True:
+            try:
+                yield pickle.load(f)
+            except EOFError:
+                break
+
+def write_cache_entry(cache_path, frames):
+    """Pickle frames into a cache sidecar while passing them through to the caller.
+
+    The sidecar only becomes visible once every frame has been written, so a
+    consumer that stops early or a failing disk never leaves a partial entry.
+    """
+    tmp_path = f'{cache_path}.{os.getpid()}.{threading.get_ident()}.tmp'
+    f = None
+    try:
+        f = open(tmp_path, 'wb')
+    except OSError:
+        pass
+    completed = False
+    try:
+        for frame in frames:
+            if f is not None:
+                try:
+                    pickle.dump(frame, f, protocol=pickle.HIGHEST_PROTOCOL)
+                except OSError:
+                    f.close()
+                    f = None
+                    os.remove(tmp_path)
+            yield frame
+        completed = True
+    finally:
+        if f is not None:
+            f.close()
+            try:
+                if completed:
+                    os.replace(tmp_path, cache_path)
+                    enforce_excel_cache_limit()
+                else:
+                    os.remove(tmp_path)
+            except OSError:
+                if os.path.exists(tmp_path):
+                    os.remove(tmp_path)
+
+def enforce_excel_cache_limit(max_bytes=None):
+    """Evict least recently used sidecars and database snapshots until the cache fits in max_bytes.
+
+    Snapshots in use count towards the size but are never evicted.
+    """
+    max_bytes = EXCEL_CACHE_MAX_BYTES if max_bytes is None else max(max_bytes, 0)
+    with _excel_cache_lock:
+        entries = []
+        for directory, suffixes in ((EXCEL_CACHE_DIR, ('.pkl',)), (SNAPSHOT_DIR, ('.db', '.db.gz'))):
+            try:
+                names = os.listdir(directory)
+            except OSError:
+                continue  # No snapshot taken yet
+            for entry in names:
+                if not entry.endswith(suffixes):
+                    continue
+                path = os.path.join(directory, entry)
+                try:
+                    st = os.stat(path)
+                except OSError:
+                    continue
+                entries.append((st.st_mtime, st.st_size, path))
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total <= max_bytes:
+                break
+            if os.path.abspath(path) in _snapshots_in_use:
+                continue
+            try:
+                os.remove(path)
+                total -= size
+            except OSError:
+                pass
+
+def iter_excel_chunks(excel_path, sheet_name=0, chunk_size=IMPORT_CHUNK_SIZE):
+    """Stream a worksheet as DataFrames, from the parsed-sheet cache when possible.
+
+    A cache hit yields the chunks exactly as they were stored, so chunk_size only
+    applies when the workbook has to be parsed.
+    """
+    cache_path = sheet_cache_path(excel_path, sheet_name)
+    if os.path.exists(cache_path):
+        print(f"DEBUG: Reading sheet {sheet_name} of {excel_path} from cache")
+        return read_cache_entry(cache_path)
+    return write_cache_entry(cache_path, parse_excel_chunks(excel_path, sheet_name, chunk_size))
+
+def read_excel_preview(excel_path, sheet_name=0, nrows=PREVIEW_ROWS):
+    """Read the header and the first nrows of a sheet for the mapping page"""
+    preview_path = sheet_cache_path(excel_path, sheet_name, kind=f'preview{nrows}')
+    if os.path.exists(preview_path):
+        return next(read_cache_entry(preview_path))
+    chunks = []
+    total = 0
+    if os.path.exists(sheet_cache_path(excel_path, sheet_name)):
+        source = iter_excel_chunks(excel_path, sheet_name)
+    else:
+        # Parse just the top of the sheet rather than the whole workbook
+        source = parse_excel_chunks(excel_path, sheet_name, chunk_size=nrows)
+    for chunk in source:
+        chunks.append(chunk)
+        total += len(chunk)
+        if total >= nrows:
+            break
+    source.close()
+    df = pd.concat(chunks, ignore_index=True) if len(chunks) > 1 else chunks[0]
+    # Let pandas pick numeric/datetime dtypes so type prediction sees what read_excel would
+    df = df.head(nrows).infer_objects()
+    for _ in write_cache_entry(preview_path, [df]):
+        pass
+    return df
+
+def list_excel_sheets(excel_path):
+    """Get the sheet names of a workbook, remembered per file version"""
+    key = file_fingerprint(excel_path)
+    with _excel_cache_lock:
+        if key in _sheet_names_cache:
+            return _sheet_names_cache[key]
+    wb = load_workbook(excel_path, read_only=True)
+    try:
+        names = list(wb.sheetnames)
+    finally:
+        wb.close()
+    with _excel_cache_lock:
+        _sheet_names_cache[key] = names
+    return names
+
+_DATETIME_TYPES = [datetime.datetime, datetime.date, pd.Timestamp]
+_NUMBER_TYPES = [int, float]
+
+def detect_date_format(values, formats=DATE_FORMATS):
+    """Return the format in formats that parses most of a sample of date strings, or None"""
+    sample = values.head(DATE_SAMPLE_SIZE)
+    best_format, best_hits = None, 0
+    for fmt in formats:
+        hits = pd.to_datetime(sample, format=fmt, errors='coerce').notna().sum()
+        if hits > best_hits:
+            best_format, best_hits = fmt, hits
+            if hits == len(sample):
+                break
+    return best_format
+
+def parse_dates(values, date_formats=None):
+    """Convert a column of Excel date values to datetime64 in a single pass.
+
+    The format of text dates is detected from a sample and the whole column
+    is converted with it; date cells pass through that same conversion. Only
+    the values it leaves missing are looked at again: numbers are read as
+    Excel serial dates and text in other formats (mixed-format columns) is
+    parsed with the next best format, so a mixed column never needs a full
+    re-parse. date_formats caches {column name: detected format} across
+    the chunks of one import so detection only runs once per column.
+    """
+    if pd.api.types.is_datetime64_any_dtype(values.dtype):
+        return pd.to_datetime(values, errors='coerce')
+    result = pd.Series(pd.NaT, index=values.index, dtype='datetime64[ns]')
+    if pd.api.types.is_bool_dtype(values.dtype):
+        return result
+    if pd.api.types.is_numeric_dtype(values.dtype):
+        return parse_excel_serials(values, result)
+
+    if date_formats is None:
+        date_formats = {}
+    fmt = date_formats.get(values.name)
+    if fmt is None:
+        fmt = detect_date_format(_date_text(values.head(DATE_SAMPLE_SIZE * 5)))
+        if fmt is not None:
+            date_formats[values.name] = fmt
+    # Columns of date cells only have no text format, any format lets them pass through
+    result = pd.to_datetime(values, format=fmt or DATE_FORMATS[0], errors='coerce')
+    values = values[result.isna() & values.notna()]
+    if len(values) == 0:
+        return result
+
+    # Whatever the column format did not match: date cells, Excel serials and text in other formats
+    result = result.astype('datetime64[ns]')
+    kinds = values.map(type)
+    datetimes = values[kinds.isin(_DATETIME_TYPES)]
+    if len(datetimes):
+        result[datetimes.index] = pd.to_datetime(datetimes, errors='coerce')
+    parse_excel_serials(pd.to_numeric(values[kinds.isin(_NUMBER_TYPES)]), result)
+    text = _date_text(values[kinds == str])
+    untried = list(DATE_FORMATS)
+    while len(text) and untried:
+        fmt = detect_date_format(text, untried)
+        if fmt is None:
+            break
+        untried.remove(fmt)
+        parsed = pd.to_datetime(text, format=fmt, errors='coerce')
+        matched = parsed.notna()
+        result[parsed.index[matched]] = parsed[matched]
+        text = text[~matched]
+    return result
+
+def _date_text(values):
+    """The non-empty strings of values, stripped"""
+    text = values[values.map(type) == str].str.strip()
+    return text[text != '']
+
+def parse_excel_serials(numbers, result):
+    """Fill result with the dates of Excel serial date numbers"""
+    numbers = numbers[(numbers >= 1) & (numbers <= EXCEL_SERIAL_MAX)]
+    if len(numbers):
+        dates = pd.to_datetime(numbers, unit='D', origin=EXCEL_EPOCH, errors='coerce')
+        # Excel goes up to 9999-12-31 but result holds nanoseconds, which end in 2262; later dates stay missing
+        dates = dates[dates <= pd.Timestamp.max]
+        result[dates.index] = dates
+    return result
+
+def format_iso_dates(dates):
+    """Format datetime64 values as YYYY-MM-DD text, missing where the date is missing"""
+    # Format each distinct day once; columns usually repeat the same dates many times
+    codes, days = pd.factorize(dates.to_numpy(dtype='datetime64[D]'))
+    text = pd.Categorical.from_codes(codes, days.astype(str))
+    return pd.Series(text, index=dates.index, name=dates.name).astype(object)
+
+def convert_import_chunk(chunk, mapping, column_types, date_formats=None):
+    """Apply the column mapping and type conversions to one chunk of Excel rows.
+
+    Pass the same date_formats dict for every chunk of an import to detect
+    the format of each DATE column only once.
+    """
+    import_df = chunk[list(mapping.keys())].rename(columns=mapping)
+    for col in import_df.columns:
+        col_type = column_types.get(col, 'TEXT')
+        if col_type == 'CURRENCY':
+            # Convert to pennies/cents (multiply by 100 and round to integer)
+            values = pd.to_numeric(import_df[col], errors='coerce')
+            import_df[col] = (values.round(2) * 100).round().astype('Int64')
+        elif col_type == 'INTEGER':
+            values = pd.to_numeric(import_df[col], errors='coerce')
+            try:
+                import_df[col] = values.astype('Int64')  # Use nullable integer type
+            except TypeError:
+                # Non-integral values cannot be cast safely, fall back to truncation
+                import_df[col] = values.fillna(0).astype('int64')
+        elif col_type == 'DATE':
+            import_df[col] = format_iso_dates(parse_dates(import_df[col], date_formats))
+        elif col_type == 'REAL':
+            import_df[col] = pd.to_numeric(import_df[col], errors='coerce')
+    return import_df
+
+_SQLITE_NATIVE_TYPES = {type(None), int, float, str, bytes, bool}
+
+def _sqlite_value(value):
+    """Convert a single cell value that sqlite3 cannot bind natively"""
+    if isinstance(value, datetime.datetime):
+        return value.isoformat(' ')
+    if isinstance(value, (datetime.date, datetime.time)):
+        return value.isoformat()
+    if hasattr(value, 'item'):
+        # numpy scalars
+        return value.item()
+    return str(value)
+
+def sqlite_column_values(series):
+    """Convert a column to a list of values sqlite3 can bind, with None for missing values"""
+    if pd.api.types.is_datetime64_any_dtype(series.dtype):
+        # Same text representation DataFrame.to_sql writes for datetime columns
+        series = series.dt.strftime('%Y-%m-%d %H:%M:%S')
+    if isinstance(series.dtype, np.dtype) and series.dtype.kind in 'biuf':
+        # numpy columns convert straight to Python numbers; only floats can hold missing values (NaN)
+        values = series.to_numpy()
+        if values.dtype.kind != 'f' or not np.isnan(values).any():
+            return values.tolist()
+    elif pd.api.types.is_numeric_dtype(series.dtype):
+        # Nullable extension columns such as Int64
+        return series.to_numpy(dtype=object, na_value=None).tolist()
+    values = series.to_numpy(dtype=object, copy=True)
+    mask = pd.isna(values)
+    if mask.any():
+        values[mask] = None
+    values = values.tolist()
+    if series.dtype == object and set(map(type, values)) - _SQLITE_NATIVE_TYPES:
+        values = [v if type(v) in _SQLITE_NATIVE_TYPES else _sqlite_value(v) for v in values]
+    return values
+
+def sqlite_rows(df):
+    """Turn a DataFrame into a list of row tuples ready for executemany"""
+    return list(zip(*(sqlite_column_values(df[col]) for col in df.columns)))
+
+def apply_import_pragmas(conn, pragmas=None):
+    """Switch a connection to bulk-load pragmas and return the values they replaced"""
+    saved = {}
+    for name, value in (IMPORT_PRAGMAS if pragmas is None else pragmas).items():
+        saved[name] = conn.execute(f'PRAGMA {name}').fetchone()[0]
+        conn.execute(f'PRAGMA {name} = {value}')
+    return saved
+
+def restore_pragmas(conn, saved):
+    """Restore pragma values returned by apply_import_pragmas"""
+    for name, value in saved.items():
+        try:
+            conn.execute(f'PRAGMA {name} = {value}')
+        except sqlite3.OperationalError as e:
+            print(f"DEBUG: Could not restore PRAGMA {name} = {value}: {e}")
+
+def value_hashes(values):
+    """64-bit hashes of an array of non-NULL values, numeric or the objects bound to SQLite.
+
+    Numbers are hashed as float64 so an integer hashes like the equal REAL,
+    whether it comes from an Int64 import column or a column read back from
+    SQLite with NULLs (float64). Text is hashed as it is, without a string
+    conversion of the whole column.
+    """
+    if values.dtype == object:
+        return pd.util.hash_array(values, categorize=False)
+    return pd.util.hash_array(values.astype(np.float64, copy=False))
+
+def hll_registers(values):
+    """HyperLogLog registers of the distinct values taken by value_hashes, as a uint8 array"""
+    registers = np.zeros(2 ** HLL_PRECISION, dtype=np.uint8)
+    if len(values) == 0:
+        return registers
+    hashes = value_hashes(values)
+    index = (hashes >> np.uint64(64 - HLL_PRECISION)).astype(np.intp)
+    rest = hashes & np.uint64((1 << (64 - HLL_PRECISION)) - 1)
+    # Position of the leftmost 1 bit in the remaining bits; frexp's exponent is the bit length
+    rank = (64 - HLL_PRECISION) - np.frexp(rest.astype(np.float64))[1] + 1
+    np.maximum.at(registers, index, rank.astype(np.uint8))
+    return registers
+
+def hll_estimate(registers):
+    """Estimated number of distinct values from HyperLogLog registers"""
+    m = len(registers)
+    estimate = 0.7213 / (1 + 1.079 / m) * m * m / np.sum(np.ldexp(1.0, -registers.astype(np.int32)))
+    zeros = int(np.count_nonzero(registers == 0))
+    if estimate <= 2.5 * m and zeros:
+        # Linear counting is more accurate for small cardinalities
+        estimate = m * np.log(m / zeros)
+    return int(round(estimate))
+
+def _sqlite_order(value):
+    """Sort key ordering mixed values as SQLite does: numbers, then text, then blobs"""
+    if isinstance(value, (int, float)):
+        return (0, value)
+    return (1, value) if isinstance(value, str) else (2, value)
+
+def _column_min_max(values):
+    """Smallest and largest of non-NULL values as taken by value_hashes, in SQLite's order, or (None, None)"""
+    if len(values) == 0:
+        return None, None
+    if values.dtype != object:
+        return values.min().item(), values.max().item()
+    try:
+        return values.min(), values.max()
+    except TypeError:
+        # Text mixed with numbers
+        return min(values, key=_sqlite_order), max(values, key=_sqlite_order)
+
+class ColumnStats:
+    """Per-column statistics of the rows loaded into a table, merged batch by batch.
+
+    For every column: rows, NULLs, min/max (in SQLite's order), a HyperLogLog
+    sketch estimating the distinct values and, for currency columns, the sum
+    of the stored cents.
+    """
+
+    def __init__(self, currency_columns=()):
+        self.currency_columns = set(currency_columns)
+        self.rows = 0
+        self.columns = {}
+
+    def add(self, df):
+        """Add the rows of a DataFrame whose columns are table column names"""
+        for col in df.columns:
+            series = df[col]
+            if pd.api.types.is_numeric_dtype(series.dtype) and not pd.api.types.is_bool_dtype(series.dtype):
+                # Integers stay int64 so large ones keep exact minimums and maximums
+                dtype = np.int64 if pd.api.types.is_integer_dtype(series.dtype) else np.float64
+                missing = series.isna().to_numpy()
+                present = series.to_numpy(dtype=dtype, na_value=0)[~missing]
+            else:
+                # Object columns are used as they are; only text and numbers need no conversion for SQLite
+                values = series.to_numpy(dtype=object)
+                present = values[pd.notna(values)]
+                if set(map(type, present)) - _SQLITE_NATIVE_TYPES:
+                    present = np.array(sqlite_column_values(pd.Series(present, dtype=object)), dtype=object)
+            low, high = _column_min_max(present)
+            total = None
+            if col in self.currency_columns:
+                if present.dtype == object:
+                    present_numbers = pd.to_numeric(pd.Series(present), errors='coerce').fillna(0)
+                    total = int(present_numbers.sum())
+                else:
+                    total = int(present.sum())
+            batch = {'rows': len(series), 'nulls': len(series) - len(present), 'min': low, 'max': high,
+                     'total': total, 'registers': hll_registers(present)}
+            previous = self.columns.get(col) or empty_column_stats(self.rows)
+            self.columns[col] = merge_column_stats(previous, batch)
+        for col in set(self.columns) - set(df.columns):
+            self.columns[col] = merge_column_stats(self.columns[col], empty_column_stats(len(df)))
+        self.rows += len(df)
+
+def empty_column_stats(rows):
+    """Statistics of a column that is NULL in all of rows rows"""
+    return {'rows': rows, 'nulls': rows, 'min': None, 'max': None, 'total': None,
+            'registers': np.zeros(2 ** HLL_PRECISION, dtype=np.uint8)}
+
+def merge_column_stats(a, b):
+    """Statistics of a column over the rows of both a and b"""
+    lows = [v for v in (a['min'], b['min']) if v is not None]
+    highs = [v for v in (a['max'], b['max']) if v is not None]
+    totals = [v for v in (a['total'], b['total']) if v is not None]
+    return {'rows': a['rows'] + b['rows'], 'nulls': a['nulls'] + b['nulls'],
+            'min': min(lows, key=_sqlite_order) if lows else None,
+            'max': max(highs, key=_sqlite_order) if highs else None,
+            'total': sum(totals) if totals else None,
+            'registers': np.maximum(a['registers'], b['registers'])}
+
+def create_column_stats_table(conn):
+    # min_value/max_value have no declared type so they keep the type of the column's values
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS column_stats (
+            table_name TEXT,
+            column_name TEXT,
+            row_count INTEGER,
+            null_count INTEGER,
+            min_value,
+            max_value,
+            total INTEGER,
+            distinct_sketch BLOB,
+            PRIMARY KEY (table_name, column_name)
+        )
+    ''')
+
+def load_column_stats(conn, table=None):
+    """Stored column statistics as {table: {column: stats}}, with the distinct estimate as 'distinct'"""
+    sql = 'SELECT table_name, column_name, row_count, null_count, min_value, max_value, total, distinct_sketch ' \
+          'FROM column_stats'
+    try:
+        rows = conn.execute(sql + (' WHERE table_name = ?' if table else ''), (table,) if table else ()).fetchall()
+    except sqlite3.OperationalError:
+        return {}  # No statistics yet
+    stats = {}
+    for table_name, column_name, row_count, null_count, low, high, total, sketch in rows:
+        registers = np.frombuffer(sketch, dtype=np.uint8).copy()
+        stats.setdefault(table_name, {})[column_name] = {
+            'rows': row_count, 'nulls': null_count, 'min': low, 'max': high, 'total': total,
+            'registers': registers, 'distinct': hll_estimate(registers)}
+    return stats
+
+def save_column_stats(conn, table, stats, replace=False):
+    """Merge a ColumnStats into the stored statistics of table, or replace them; runs in the caller's transaction"""
+    create_column_stats_table(conn)
+    stored = {} if replace else load_column_stats(conn, table).get(table, {})
+    if replace:
+        conn.execute('DELETE FROM column_stats WHERE table_name = ?', (table,))
+    stored_rows = max((col_stats['rows'] for col_stats in stored.values()), default=0)
+    table_columns = [row[1] for row in conn.execute(f"PRAGMA table_info('{table}')")]
+    rows = []
+    for col in set(stored) | set(stats.columns) | set(table_columns):
+        # Columns missing on one side were NULL in those rows
+        merged = merge_column_stats(stored.get(col) or empty_column_stats(stored_rows),
+                                    stats.columns.get(col) or empty_column_stats(stats.rows))
+        rows.append((table, col, merged['rows'], merged['nulls'], merged['min'], merged['max'],
+                     merged['total'], merged['registers'].tobytes()))
+    conn.executemany('INSERT OR REPLACE INTO column_stats VALUES (?, ?, ?, ?, ?, ?, ?, ?)', rows)
+
+def rebuild_column_stats(conn, table, currency_columns=()):
+    """Recompute the statistics of table from its rows, for tables loaded before they were kept"""
+    print(f"DEBUG: Building column statistics of {table}")
+    currency = set(currency_columns) | {col for col, info in get_column_metadata(conn, table).items()
+                                        if info['is_currency']}
+    stats = ColumnStats(currency)
+    for chunk in pd.read_sql_query(f'SELECT * FROM "{table}"', conn, chunksize=IMPORT_CHUNK_SIZE):
+        stats.add(chunk)
+    save_column_stats(conn, table, stats, replace=True)
+
+def column_stats_summary(col_stats, info):
+    """One line describing the stored statistics of a column for view_db"""
+    def shown(value):
+        if info and info['is_currency'] and isinstance(value, (int, float)):
+            return f'${value / 100:.2f}'
+        if info and info['is_date'] and isinstance(value, str):
+            date = pd.to_datetime(value, errors='coerce')
+            return value if pd.isna(date) else date.strftime('%m/%d/%Y')
+        return str(value)
+    parts = [f"{col_stats['nulls']} empty", f"~{col_stats['distinct']} distinct"]
+    if col_stats['min'] is not None:
+        parts.append(f"{shown(col_stats['min'])} to {shown(col_stats['max'])}")
+    if col_stats['total'] is not None:
+        parts.append(f"total {shown(col_stats['total'])}")
+    return ', '.join(parts)
+
+class BulkLoader:
+    """Bulk insert DataFrames into one table inside a single explicit transaction.
+
+    The write lock is taken up front with BEGIN IMMEDIATE and the whole load
+    commits or rolls back as one. Columns are converted to Python values
+    once and bound with prepared multi-row INSERT statements, batch_size
+    rows per executemany call, with IMPORT_PRAGMAS applied for the duration
+    of the load; benchmarks/bulk_load.py compares it with DataFrame.to_sql.
+    Use it as a context manager: the transaction commits on a clean exit and
+    rolls back on an exception, and the previous pragmas are restored either way.
+    rows_processed counts the rows handed to the loader and rows_inserted
+    the rows written by it. Given column_types, the column statistics of the
+    inserted rows are merged into column_stats in the same transaction.
+    """
+
+    def __init__(self, conn, table, batch_size=INSERT_BATCH_SIZE, column_types=None):
+        self.conn = conn
+        self.table = table
+        self.batch_size = batch_size
+        self.rows_processed = 0
+        self.rows_inserted = 0
+        self._saved_pragmas = {}
+        self.stats = None
+        if column_types is not None:
+            self.stats = ColumnStats(col for col, col_type in column_types.items() if col_type == 'CURRENCY')
+        self._had_rows = False
+
+    def __enter__(self):
+        if self.conn.in_transaction:
+            self.conn.commit()
+        self._saved_pragmas = apply_import_pragmas(self.conn)
+        # Take the write lock up front instead of upgrading a read lock mid-load
+        self.conn.execute('BEGIN IMMEDIATE')
+        try:
+            self._had_rows = bool(self.conn.execute(f'SELECT EXISTS (SELECT 1 FROM "{self.table}")').fetchone()[0])
+        except sqlite3.OperationalError:
+            self._had_rows = False  # Created later, e.g. the staging table
+        return self
+
+    def insert(self, df):
+        """Insert all rows of df, whose columns are table column names; returns the row count"""
+        self.rows_processed += len(df)
+        return self._insert(df)
+
+    def _insert(self, df):
+        if df.empty:
+            return 0
+        names = ', '.join(f'"{col}"' for col in df.columns)
+        row_placeholders = '(' + ', '.join('?' for _ in df.columns) + ')'
+        # Binding several rows per statement saves most of sqlite3's per-statement overhead
+        rows_per_statement = max(INSERT_MAX_PARAMETERS // len(df.columns), 1)
+        multi_row_sql = (f'INSERT INTO "{self.table}" ({names}) VALUES '
+                         + ', '.join([row_placeholders] * rows_per_statement))
+        single_row_sql = f'INSERT INTO "{self.table}" ({names}) VALUES {row_placeholders}'
+        columns = [sqlite_column_values(df[col]) for col in df.columns]
+        width = rows_per_statement * len(columns)
+        cur = self.conn.cursor()
+        for start in range(0, len(df), self.batch_size):
+            end = min(start + self.batch_size, len(df))
+            full = start + (end - start) // rows_per_statement * rows_per_statement
+            if full > start:
+                flat = list(itertools.chain.from_iterable(zip(*(values[start:full] for values in columns))))
+                cur.executemany(multi_row_sql, [flat[i:i + width] for i in range(0, len(flat), width)])
+            if end > full:
+                cur.executemany(single_row_sql, zip(*(values[full:end] for values in columns)))
+        self.rows_inserted += len(df)
+        if self.stats is not None:
+            self.stats.add(df)
+        return len(df)
+
+    def save_stats(self):
+        """Merge the statistics of the inserted rows into column_stats"""
+        if self.stats is None:
+            return
+        if self._had_rows and self.table not in load_column_stats(self.conn, self.table):
+            # The rows already there were loaded before statistics were kept
+            rebuild_column_stats(self.conn, self.table, self.stats.currency_columns)
+        else:
+            save_column_stats(self.conn, self.table, self.stats)
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        try:
+            if exc_type is None:
+                try:
+                    self.save_stats()
+                except BaseException:
+                    self.conn.rollback()
+                    raise
+                self.conn.commit()
+            else:
+                self.conn.rollback()
+        finally:
+            restore_pragmas(self.conn, self._saved_pragmas)
+        return False
+
+def row_hash_table(table):
+    """Name of the table holding the row hashes of table for incremental imports"""
+    return f'{table}__rowhash'
+
+def is_internal_table(table_name):
+    """Whether a table is bookkeeping of the importer rather than imported data"""
+    # {table}__fts is the full-text index, {table}__fts_data etc. are the tables FTS5 keeps it in
+    return (table_name.endswith(('__rowhash', '__staging', '__fts')) or '__fts_' in table_name
+            or table_name in ('row_hash_state', 'import_ledger', 'auto_indexes', 'column_stats'))
+
+def create_ledger_table(conn):
+    """Create the table recording which files were imported into which table with which mapping"""
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS import_ledger (
+            content_hash TEXT,
+            sheets TEXT,
+            table_name TEXT,
+            mapping_hash TEXT,
+            file_name TEXT,
+            file_size INTEGER,
+            mapping TEXT,
+            rows INTEGER,
+            imported_at TEXT,
+            PRIMARY KEY (content_hash, sheets, table_name, mapping_hash)
+        )
+    ''')
+
+def import_ledger_key(excel_path, sheets, mapping):
+    """Identify an import of the selected sheets of a file with a mapping, for the import ledger.
+
+    mapping is anything JSON-serializable that determines what gets written,
+    e.g. the column mappings, types and company.
+    """
+    mapping_json = json.dumps(mapping, sort_keys=True, default=str)
+    return {
+        'content_hash': file_sha256(excel_path),
+        'sheets': ', '.join(str(sheet) for sheet in sheets),
+        'mapping_hash': hashlib.sha256(mapping_json.encode('utf-8')).hexdigest(),
+        'file_name': os.path.basename(excel_path),
+        'file_size': os.path.getsize(excel_path),
+        'mapping': mapping_json
+    }
+
+def find_import(conn, table, ledger_key):
+    """The ledger entry of an earlier identical import into table, or None"""
+    try:
+        row = conn.execute('''
+            SELECT file_name, rows, imported_at FROM import_ledger
+            WHERE content_hash = ? AND sheets = ? AND table_name = ? AND mapping_hash = ?
+        ''', (ledger_key['content_hash'], ledger_key['sheets'], table, ledger_key['mapping_hash'])).fetchone()
+    except sqlite3.OperationalError:
+        return None  # No ledger yet
+    if row is None:
+        return None
+    return {'file_name': row[0], 'rows': row[1], 'imported_at': row[2]}
+
+def record_import(conn, table, ledger_key, rows):
+    """Add an import to the ledger; runs in the caller's transaction so it commits with the rows"""
+    create_ledger_table(conn)
+    conn.execute('''
+        INSERT OR REPLACE INTO import_ledger
+            (content_hash, sheets, table_name, mapping_hash, file_name, file_size, mapping, rows, imported_at)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+    ''', (ledger_key['content_hash'], ledger_key['sheets'], table, ledger_key['mapping_hash'],
+          ledger_key['file_name'], ledger_key['file_size'], ledger_key['mapping'], rows,
+          datetime.datetime.now().isoformat(timespec='seconds')))
+
+def forget_table(conn, table):
+    """Remove what the importer keeps about a table, after the table itself was dropped"""
+    drop_row_hashes(conn, table)
+    disable_fulltext(conn, table)
+    for bookkeeping in ('import_ledger', 'auto_indexes', 'column_stats'):
+        try:
+            conn.execute(f'DELETE FROM {bookkeeping} WHERE table_name = ?', (table,))
+        except sqlite3.OperationalError:
+            pass  # Table not created yet
+    conn.commit()
+
+def row_hashes(df):
+    """Stable 64-bit hash of every row of df, computed from the values as SQLite stores them"""
+    # Text form of the bound values, so rows read back from SQLite hash the same as imported ones
+    canonical = pd.DataFrame({col: sqlite_column_values(df[col]) for col in df.columns},
+                             index=df.index, dtype=object).astype(str)
+    return pd.util.hash_pandas_object(canonical, index=False).to_numpy().view('int64')
+
+def drop_row_hashes(conn, table):
+    """Forget the row hashes of table; the next incremental import rebuilds them"""
+    conn.execute(f'DROP TABLE IF EXISTS "{row_hash_table(table)}"')
+    conn.commit()
+
+class StagingLoader(BulkLoader):
+    """Bulk loader that replaces all rows of a table by loading a staging copy and swapping it in.
+
+    Rows go into {table}__staging, created from the table's CREATE TABLE
+    statement but without its indexes. On a clean exit the live table is
+    dropped, the staging table renamed to it and the indexes created once
+    over the loaded rows, all in the load's transaction, so readers keep
+    seeing the old rows until the new ones are complete. The table's
+    import_ledger entries are dropped with the rows they describe.
+    column_metadata is keyed by table name and the columns are unchanged,
+    so it stays valid.
+    """
+
+    def __init__(self, conn, table, batch_size=INSERT_BATCH_SIZE, column_types=None):
+        super().__init__(conn, staging_table(table), batch_size, column_types)
+        self.live_table = table
+
+    def save_stats(self):
+        """The loaded rows are all the table holds, so their statistics replace the stored ones"""
+        if self.stats is not None:
+            save_column_stats(self.conn, self.live_table, self.stats, replace=True)
+
+    def __enter__(self):
+        super().__enter__()
+        try:
+            table_sql = self.conn.execute("SELECT sql FROM sqlite_master WHERE type='table' AND name=?",
+                                          (self.live_table,)).fetchone()[0]
+            self.conn.execute(f'DROP TABLE IF EXISTS "{self.table}"')
+            self.conn.execute(re.sub(r'^CREATE TABLE\s+("[^"]+"|\[[^\]]+\]|`[^`]+`|[^\s(]+)',
+                                     f'CREATE TABLE "{self.table}"', table_sql, count=1))
+            # The files imported before are replaced too; only imports recorded during this load remain
+            try:
+                self.conn.execute('DELETE FROM import_ledger WHERE table_name = ?', (self.live_table,))
+            except sqlite3.OperationalError:
+                pass  # No ledger yet
+        except BaseException:
+            super().__exit__(*sys.exc_info())
+            raise
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            try:
+                index_sql = [row[0] for row in self.conn.execute(
+                    "SELECT sql FROM sqlite_master WHERE type='index' AND tbl_name=? AND sql IS NOT NULL",
+                    (self.live_table,))]
+                fulltext = fulltext_columns(self.conn, self.live_table)
+                self.conn.execute(f'DROP TABLE "{self.live_table}"')
+                self.conn.execute(f'ALTER TABLE "{self.table}" RENAME TO "{self.live_table}"')
+                for sql in index_sql:
+                    self.conn.execute(sql)
+                if fulltext:
+                    # The triggers went with the old table; index the new rows in one pass
+                    create_fulltext(self.conn, self.live_table, fulltext)
+                # The row hashes describe the rows that were just replaced
+                self.conn.execute(f'DROP TABLE IF EXISTS "{row_hash_table(self.live_table)}"')
+            except BaseException:
+                super().__exit__(*sys.exc_info())
+                raise
+        return super().__exit__(exc_type, exc_value, traceback)
+
+def staging_table(table):
+    """Name of the table a replace import loads into before it is swapped in"""
+    return f'{table}__staging'
+
+def fulltext_table(table):
+    """Name of the FTS5 full-text index of table"""
+    return f'{table}__fts'
+
+def fulltext_columns(conn, table):
+    """Columns of table in its full-text index, or None if the table has no full-text index"""
+    if not conn.execute("SELECT 1 FROM sqlite_master WHERE type='table' AND name=?",
+                        (fulltext_table(table),)).fetchone():
+        return None
+    return [row[1] for row in conn.execute(f'PRAGMA table_info("{fulltext_table(table)}")')]
+
+def text_columns(conn, table):
+    """The TEXT columns of table as chosen at import, dates excluded; SQLite's declared types without metadata"""
+    metadata = get_column_metadata(conn, table)
+    columns = []
+    for _, name, declared_type, *_ in conn.execute(f"PRAGMA table_info('{table}')"):
+        info = metadata.get(name)
+        if (info['type'] == 'TEXT') if info else declared_type.upper() == 'TEXT':
+            columns.append(name)
+    return columns
+
+def create_fulltext(conn, table, columns):
+    """(Re)create the full-text index of table over columns and fill it, in the caller's transaction.
+
+    The index is an external content FTS5 table reading the values from
+    table itself, kept in sync by triggers, so rows written by imports are
+    indexed in the import's transaction.
+    """
+    fts = fulltext_table(table)
+    drop_fulltext_triggers(conn, table)
+    conn.execute(f'DROP TABLE IF EXISTS "{fts}"')
+    names = ', '.join(f'"{col}"' for col in columns)
+    old_values = ', '.join(f'old."{col}"' for col in columns)
+    new_values = ', '.join(f'new."{col}"' for col in columns)
+    conn.execute(f'CREATE VIRTUAL TABLE "{fts}" USING fts5({names}, content=\'{table}\', '
+                 f'content_rowid=\'rowid\', tokenize=\'unicode61 remove_diacritics 2\')')
+    conn.execute(f'CREATE TRIGGER "{fts}_insert" AFTER INSERT ON "{table}" BEGIN '
+                 f'INSERT INTO "{fts}" (rowid, {names}) VALUES (new.rowid, {new_values}); END')
+    conn.execute(f'CREATE TRIGGER "{fts}_delete" AFTER DELETE ON "{table}" BEGIN '
+                 f'INSERT INTO "{fts}" ("{fts}", rowid, {names}) VALUES (\'delete\', old.rowid, {old_values}); END')
+    conn.execute(f'CREATE TRIGGER "{fts}_update" AFTER UPDATE ON "{table}" BEGIN '
+                 f'INSERT INTO "{fts}" ("{fts}", rowid, {names}) VALUES (\'delete\', old.rowid, {old_values}); '
+                 f'INSERT INTO "{fts}" (rowid, {names}) VALUES (new.rowid, {new_values}); END')
+    conn.execute(f'INSERT INTO "{fts}" ("{fts}") VALUES (\'rebuild\')')
+
+def drop_fulltext_triggers(conn, table):
+    for trigger in ('insert', 'delete', 'update'):
+        conn.execute(f'DROP TRIGGER IF EXISTS "{fulltext_table(table)}_{trigger}"')
+
+def disable_fulltext(conn, table):
+    """Drop the full-text index of table, if it has one"""
+    drop_fulltext_triggers(conn, table)
+    conn.execute(f'DROP TABLE IF EXISTS "{fulltext_table(table)}"')
+    conn.commit()
+
+def fulltext_query(text):
+    """FTS5 query matching rows containing all words of text, each as a word prefix; None without words"""
+    words = re.findall(r'\w+', text)
+    if not words:
+        return None
+    return ' '.join('"' + word.replace('"', '""') + '"*' for word in words)
+
+def fulltext_condition(table):
+    """WHERE clause limiting table to the rows matching a full-text query, bound as its only parameter"""
+    fts = fulltext_table(table)
+    return f'"{table}".rowid IN (SELECT rowid FROM "{fts}" WHERE "{fts}" MATCH ?)'
+
+def fetch_ranked(conn, table, query, page_size, offset=0, select='*', where='', where_params=()):
+    """One page of the rows of table matching a full-text query, best matches (bm25) first"""
+    fts = fulltext_table(table)
+    condition = f' AND ({where})' if where else ''
+    return pd.read_sql_query(f'SELECT {select} FROM "{fts}" JOIN "{table}" ON "{table}".rowid = "{fts}".rowid '
+                             f'WHERE "{fts}" MATCH ?{condition} ORDER BY "{fts}".rank LIMIT ? OFFSET ?',
+                             conn, params=[query] + list(where_params) + [page_size, offset])
+
+def open_loader(conn, table, column_types, mode='append', key_columns=None):
+    """Get the loader for an import mode.
+
+    'append' inserts every row, 'incremental' only new or changed rows and
+    'replace' swaps in a table holding just the imported rows.
+    """
+    if mode == 'incremental':
+        return IncrementalLoader(conn, table, column_types, key_columns)
+    if mode == 'replace':
+        return StagingLoader(conn, table, column_types=column_types)
+    # Appended rows are not in the row hashes, so rebuild them on the next incremental import
+    drop_row_hashes(conn, table)
+    return BulkLoader(conn, table, column_types=column_types)
+
+def loader_summary(loader):
+    """Describe what a loader wrote, for job messages and the batch summary"""
+    if isinstance(loader, IncrementalLoader):
+        return (f'{loader.rows_inserted} new rows, {loader.rows_updated} updated, '
+                f'{loader.rows_unchanged} unchanged')
+    if isinstance(loader, StagingLoader):
+        return f'{loader.rows_inserted} rows, replacing all previous rows,'
+    return f'{loader.rows_inserted} rows'
+
+class IncrementalLoader(BulkLoader):
+    """Bulk loader that only writes rows that are new or changed since earlier imports.
+
+    Every imported row is recorded in {table}__rowhash as (key_hash, row_hash,
+    row_id): row_hash hashes all columns, key_hash the key_columns, and
+    row_id is the rowid of the row in table. A row whose key is unknown is
+    inserted, a row whose key is known but whose row_hash differs updates
+    that row, and anything else is skipped. Without key columns the whole
+    row is the key, so changed rows are inserted as new rows and identical
+    rows are imported once. The hashes are built from the rows already in
+    the table the first time, and again whenever columns or key_columns
+    change.
+    """
+
+    def __init__(self, conn, table, columns, key_columns=None, batch_size=INSERT_BATCH_SIZE):
+        super().__init__(conn, table, batch_size, columns)
+        self.columns = sorted(columns)
+        self.key_columns = sorted(key_columns or [])
+        missing = [col for col in self.key_columns if col not in self.columns]
+        if missing:
+            raise ValueError(f'Key columns are not imported: {", ".join(missing)}')
+        self.hash_table = row_hash_table(table)
+        self.rows_updated = 0
+        self.rows_unchanged = 0
+
+    def __enter__(self):
+        super().__enter__()
+        try:
+            self._prepare_hashes()
+        except BaseException:
+            self.__exit__(*sys.exc_info())
+            raise
+        return self
+
+    def _prepare_hashes(self):
+        signature = json.dumps({'columns': self.columns, 'key_columns': self.key_columns})
+        self.conn.execute('CREATE TABLE IF NOT EXISTS row_hash_state (table_name TEXT PRIMARY KEY, signature TEXT)')
+        row = self.conn.execute('SELECT signature FROM row_hash_state WHERE table_name = ?', (self.table,)).fetchone()
+        exists = self.conn.execute("SELECT 1 FROM sqlite_master WHERE type='table' AND name=?",
+                                   (self.hash_table,)).fetchone()
+        if row and row[0] == signature and exists:
+            return
+        print(f"DEBUG: Building row hashes of {self.table}")
+        self.conn.execute(f'DROP TABLE IF EXISTS "{self.hash_table}"')
+        self.conn.execute(f'CREATE TABLE "{self.hash_table}" '
+                          f'(key_hash INTEGER PRIMARY KEY, row_hash INTEGER NOT NULL, row_id INTEGER NOT NULL)')
+        columns = ', '.join(f'"{col}"' for col in self.columns)
+        cur = self.conn.execute(f'SELECT rowid, {columns} FROM "{self.table}"')
+        while True:
+            rows = cur.fetchmany(IMPORT_CHUNK_SIZE)
+            if not rows:
+                break
+            df = pd.DataFrame(rows, columns=['rowid'] + self.columns, dtype=object)
+            key_hash, row_hash = self._hashes(df)
+            # Later duplicates of a key win, as they do during an import
+            self.conn.executemany(f'INSERT OR REPLACE INTO "{self.hash_table}" VALUES (?, ?, ?)',
+                                  zip(key_hash.tolist(), row_hash.tolist(), df['rowid'].tolist()))
+        self.conn.execute('INSERT OR REPLACE INTO row_hash_state VALUES (?, ?)', (self.table, signature))
+
+    def save_stats(self):
+        """Updated rows replaced values the statistics cannot take out again, so recompute them then"""
+        if self.rows_updated:
+            rebuild_column_stats(self.conn, self.table, self.stats.currency_columns)
+        else:
+            super().save_stats()
+
+    def _hashes(self, df):
+        row_hash = row_hashes(df[self.columns])
+        key_hash = row_hashes(df[self.key_columns]) if self.key_columns else row_hash
+        return key_hash, row_hash
+
+    def _lookup(self, key_hashes):
+        """{key_hash: (row_hash, row_id)} of the given keys that were imported before"""
+        found = {}
+        # Stay below the 999 parameter limit of older SQLite versions
+        for start in range(0, len(key_hashes), 900):
+            batch = key_hashes[start:start + 900]
+            placeholders = ', '.join('?' for _ in batch)
+            for key_hash, row_hash, row_id in self.conn.execute(
+                    f'SELECT key_hash, row_hash, row_id FROM "{self.hash_table}" WHERE key_hash IN ({placeholders})',
+                    batch):
+                found[key_hash] = (row_hash, row_id)
+        return found
+
+    def insert(self, df):
+        """Insert the new rows of df and update the changed ones; returns the number of rows written"""
+        self.rows_processed += len(df)
+        if df.empty:
+            return 0
+        df = df.reindex(columns=self.columns)
+        key_hash, row_hash = self._hashes(df)
+        hashes = pd.DataFrame({'key_hash': key_hash, 'row_hash': row_hash}, index=df.index)
+        # A key repeated within the chunk only keeps its last row
+        hashes = hashes[~hashes['key_hash'].duplicated(keep='last')]
+        found = self._lookup(hashes['key_hash'].tolist())
+        known = hashes['key_hash'].isin(found.keys())
+        previous = hashes.loc[known, 'key_hash'].map(lambda k: found[k][0])
+        changed = hashes[known].loc[hashes.loc[known, 'row_hash'] != previous]
+        new = hashes[~known]
+        self.rows_unchanged += len(df) - len(new) - len(changed)
+
+        if len(new):
+            base = self.conn.execute(f'SELECT COALESCE(MAX(rowid), 0) FROM "{self.table}"').fetchone()[0]
+            self._insert(df.loc[new.index])
+            if self.conn.execute('SELECT last_insert_rowid()').fetchone()[0] != base + len(new):
+                raise RuntimeError(f'Cannot track row ids of table "{self.table}" for an incremental import')
+            self.conn.executemany(f'INSERT INTO "{self.hash_table}" VALUES (?, ?, ?)',
+                                  zip(new['key_hash'].tolist(), new['row_hash'].tolist(),
+                                      range(base + 1, base + len(new) + 1)))
+        if len(changed):
+            row_ids = [found[k][1] for k in changed['key_hash'].tolist()]
+            assignments = ', '.join(f'"{col}" = ?' for col in self.columns)
+            self.conn.executemany(f'UPDATE "{self.table}" SET {assignments} WHERE rowid = ?',
+                                  [row + (row_id,) for row, row_id in zip(sqlite_rows(df.loc[changed.index]), row_ids)])
+            self.conn.executemany(f'UPDATE "{self.hash_table}" SET row_hash = ? WHERE key_hash = ?',
+                                  zip(changed['row_hash'].tolist(), changed['key_hash'].tolist()))
+            self.rows_updated += len(changed)
+        return len(new) + len(changed)
+
+def sqlite_type_for(col_type):
+    """Get the SQLite column type used to store an importer column type"""
+    if col_type == 'CURRENCY':
+        return 'INTEGER'  # Stored as pennies/cents
+    if col_type == 'DATE':
+        return 'TEXT'  # Store dates as text in SQLite
+    return col_type
+
+def get_db_write_lock(db_path):
+    """Get the lock that serializes import jobs writing to the same database file"""
+    key = os.path.abspath(db_path)
+    with _jobs_lock:
+        if key not in _db_write_locks:
+            _db_write_locks[key] = threading.Lock()
+        return _db_write_locks[key]
+
+def set_web_journal_mode(conn):
+    """Switch a database the web app writes to into WEB_JOURNAL_MODE, outside any transaction"""
+    if WEB_JOURNAL_MODE is None:
+        return
+    current = conn.execute('PRAGMA journal_mode').fetchone()[0]
+    if current.lower() == WEB_JOURNAL_MODE.lower():
+        return
+    mode = conn.execute(f'PRAGMA journal_mode = {WEB_JOURNAL_MODE}').fetchone()[0]
+    if mode.lower() != WEB_JOURNAL_MODE.lower():
+        print(f"DEBUG: Could not set journal_mode {WEB_JOURNAL_MODE}, still {mode}")
+
+class ImportJob:
+    """Progress and outcome of one import running on the background worker pool"""
+
+    def __init__(self, source, db_path, table):
+        self.id = uuid.uuid4().hex[:12]
+        self.source = source
+        self.db_path = db_path
+        self.table = table
+        self.stage = 'queued'
+        self.rows_processed = 0
+        self.errors = []
+        self.warnings = []
+        self.message = ''
+        self.created_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+
+    @property
+    def finished(self):
+        return self.stage in ('done', 'failed')
+
+    def rows_per_sec(self):
+        if not self.started_at:
+            return 0.0
+        elapsed = (self.finished_at or time.time()) - self.started_at
+        return round(self.rows_processed / elapsed, 1) if elapsed > 0 else 0.0
+
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'source': self.source,
+            'db': self.db_path,
+            'table': self.table,
+            'stage': self.stage,
+            'finished': self.finished,
+            'rows_processed': self.rows_processed,
+            'rows_per_sec': self.rows_per_sec(),
+            'errors': self.errors,
+            'warnings': self.warnings,
+            'message': self.message,
+            'created_at': datetime.datetime.fromtimestamp(self.created_at).isoformat(),
+            'started_at': datetime.datetime.fromtimestamp(self.started_at).isoformat() if self.started_at else None,
+            'finished_at': datetime.datetime.fromtimestamp(self.finished_at).isoformat() if self.finished_at else None,
+        }
+
+def _run_job(job, func, args, kwargs):
+    """Worker-thread wrapper recording the outcome of a job"""
+    job.started_at = time.time()
+    job.stage = 'starting'
+    try:
+        func(job, *args, **kwargs)
+        job.stage = 'done'
+    except Exception as e:
+        job.errors.append(str(e))
+        job.stage = 'failed'
+        print(f"DEBUG: Import job {job.id} failed: {e}")
+        traceback.print_exc()
+    finally:
+        job.finished_at = time.time()
+
+def submit_import_job(job, func, *args, **kwargs):
+    """Queue func(job, *args, **kwargs) on the import worker pool.
+
+    Returns the job, or None when MAX_ACTIVE_JOBS are already queued or running.
+    """
+    with _jobs_lock:
+        if sum(1 for j in _jobs.values() if not j.finished) >= MAX_ACTIVE_JOBS:
+            return None
+        # Forget the oldest finished jobs so the registry stays bounded
+        finished = sorted((j for j in _jobs.values() if j.finished), key=lambda j: j.created_at)
+        for old in finished[:max(0, len(finished) - MAX_FINISHED_JOBS + 1)]:
+            del _jobs[old.id]
+        _jobs[job.id] = job
+    _import_executor.submit(_run_job, job, func, args, kwargs)
+    return job
+
+def get_import_job(job_id):
+    """Look up a queued, running or recently finished job"""
+    with _jobs_lock:
+        return _jobs.get(job_id)
+
+def ensure_table_columns(conn, table, column_types):
+    """Create table, or the columns it is missing, for {column: type}; returns warnings.
+
+    A column that cannot be added is reported but not fatal, so the import
+    can still proceed with the other columns.
+    """
+    warnings = []
+    existing = [row[1] for row in conn.execute(f"PRAGMA table_info('{table}')")]
+    if not existing:
+        col_defs = [f'"{col}" {sqlite_type_for(col_type)}' for col, col_type in column_types.items()]
+        conn.execute(f'CREATE TABLE "{table}" ({", ".join(col_defs)})')
+        conn.commit()
+        print(f"DEBUG: Created table {table}")
+        return warnings
+    for col, col_type in column_types.items():
+        if col in existing:
+            continue
+        try:
+            conn.execute(f'ALTER TABLE "{table}" ADD COLUMN "{col}" {sqlite_type_for(col_type)}')
+            conn.commit()
+            print(f"DEBUG: Created new column {col}")
+        except sqlite3.Error as e:
+            warnings.append(f'Failed to add column {col}: {e}')
+    return warnings
+
+def iter_import_chunks(excel_path, sheet_name, mapping, column_types, company=None):
+    """Stream one sheet as chunks that are mapped and converted, ready for BulkLoader"""
+    date_formats = {}
+    for chunk in iter_excel_chunks(excel_path, sheet_name=sheet_name, chunk_size=IMPORT_CHUNK_SIZE):
+        if company:
+            chunk['LAB14COMPANY'] = company
+        yield convert_import_chunk(chunk, mapping, column_types, date_formats)
+
+def parse_sheet_for_import(excel_path, sheet_name):
+    """Process-pool worker: parse one sheet into the parsed-sheet cache, for the writer to stream from.
+
+    Nothing is returned, so no sheet is ever held in memory as a whole; if
+    the entry is evicted before the writer reads it, the writer parses the
+    sheet again itself.
+    """
+    if os.path.exists(sheet_cache_path(excel_path, sheet_name)):
+        return
+    for _ in iter_excel_chunks(excel_path, sheet_name=sheet_name, chunk_size=IMPORT_CHUNK_SIZE):
+        pass
+
+def get_parse_pool():
+    """Get the process pool that parses several sheets concurrently"""
+    global _parse_pool
+    with _jobs_lock:
+        if _parse_pool is None:
+            # Spawned rather than forked: a fork of this threaded server copies locks other threads may hold
+            _parse_pool = ProcessPoolExecutor(max_workers=PARSE_PROCESSES,
+                                              mp_context=multiprocessing.get_context('spawn'))
+        return _parse_pool
+
+def reset_parse_pool():
+    """Drop a pool whose worker processes died or hang so the next job starts a fresh one.
+
+    Sheets other imports already queued on the old pool are still parsed there.
+    """
+    global _parse_pool
+    with _jobs_lock:
+        pool, _parse_pool = _parse_pool, None
+    if pool is not None:
+        pool.shutdown(wait=False)
+
+def run_import(job, excel_path, db_path, table, sheet_mappings, column_types, new_columns=None, company=None,
+               mode='append', key_columns=None, ledger_key=None):
+    """Create missing columns and load Excel sheets into table, reporting progress on job.
+
+    sheet_mappings lists (sheet name, {excel column: table column}) pairs,
+    column_types gives the type of every mapped table column and new_columns
+    the columns that have to be added to the table first. Sheets are
+    streamed chunk by chunk; with several sheets the parse process pool
+    parses the next ones into the parsed-sheet cache meanwhile, at most
+    PARSE_PROCESSES * 2 ahead of the writer. All rows are loaded in one
+    transaction.
+    mode and key_columns are passed to open_loader. With a ledger_key the
+    import is recorded in the import ledger in the same transaction.
+    """
+    futures = {}
+
+    def parse_ahead(first):
+        # Parse the sheets from first on in the pool, a bounded number ahead of the writer
+        if len(sheet_mappings) > 1:
+            for idx in range(first, min(first + PARSE_PROCESSES * 2, len(sheet_mappings))):
+                if idx not in futures:
+                    futures[idx] = get_parse_pool().submit(parse_sheet_for_import, excel_path,
+                                                           sheet_mappings[idx][0])
+
+    # Start parsing before waiting for the database so both overlap
+    parse_ahead(0)
+    job.stage = 'waiting for database'
+    with get_db_write_lock(db_path):
+        conn = sqlite3.connect(db_path, timeout=SQLITE_TIMEOUT)
+        try:
+            job.stage = 'preparing'
+            set_web_journal_mode(conn)
+            job.warnings.extend(ensure_table_columns(conn, table, new_columns or {}))
+
+            job.stage = 'importing'
+            with open_loader(conn, table, column_types, mode, key_columns) as loader:
+                # Load the sheets in workbook order, each as soon as it is in the parsed-sheet cache
+                for idx, (sheet_name, mapping) in enumerate(sheet_mappings):
+                    if futures:
+                        job.stage = f'importing sheet {idx + 1} of {len(sheet_mappings)}'
+                        parse_ahead(idx)
+                        try:
+                            futures.pop(idx).result(timeout=PARSE_TIMEOUT)
+                        except BrokenProcessPool:
+                            reset_parse_pool()
+                            raise
+                        except TimeoutError:
+                            # A hung worker would keep its place in the pool for good
+                            reset_parse_pool()
+                            raise TimeoutError(f'Parsing sheet "{sheet_name}" took longer than {PARSE_TIMEOUT} '
+                                               f'seconds, nothing was imported') from None
+                    # Import the data chunk by chunk so memory depends on IMPORT_CHUNK_SIZE, not the sheet size
+                    for import_chunk in iter_import_chunks(excel_path, sheet_name, mapping, column_types, company):
+                        loader.insert(import_chunk)
+                        job.rows_processed = loader.rows_processed
+                if ledger_key:
+                    record_import(conn, table, ledger_key, loader.rows_processed)
+
+            job.stage = 'finalizing'
+            # Store column metadata for ALL columns (both new and existing)
+            store_column_metadata(conn, table, column_types)
+            # Store user data type choices for future prediction
+            for col, col_type in column_types.items():
+                store_user_type_choice(col, col_type)
+            flush_user_type_choices()
+        finally:
+            for future in futures.values():
+                future.cancel()
+            conn.close()
+            invalidate_result_cache(db_path, table)
+    job.message = f'Successfully imported {loader_summary(loader)} to table "{table}"'
+    return loader.rows_inserted
+
+def sort_key(order):
+    """Normalize [(column, 'ASC'|'DESC'), ...] so a sort and its exact reverse share one index"""
+    if order and order[0][1] == 'DESC':
+        order = [(col, 'DESC' if direction == 'ASC' else 'ASC') for col, direction in order]
+    return tuple(order)
+
+def auto_index_name(table, key):
+    digest = hashlib.sha1(json.dumps(key).encode('utf-8')).hexdigest()[:10]
+    return f'auto_{table}_{digest}'
+
+def create_auto_indexes_table(conn):
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS auto_indexes (
+            index_name TEXT PRIMARY KEY,
+            table_name TEXT,
+            columns TEXT,
+            hits INTEGER,
+            created_at TEXT
+        )
+    ''')
+
+def has_sort_index(conn, table, key):
+    """Whether an index of table starts with the columns of key, in its directions or all reversed"""
+    for index in conn.execute(f"PRAGMA index_list('{table}')").fetchall():
+        index_cols = [(row[2], 'DESC' if row[3] else 'ASC')
+                      for row in conn.execute(f"PRAGMA index_xinfo('{index[1]}')") if row[5]]
+        if sort_key(index_cols[:len(key)]) == key:
+            return True
+    return False
+
+def record_sort(conn, db_path, table, order):
+    """Count a sort requested on view_table and index it in the background once it is popular.
+
+    order is [(column, 'ASC'|'DESC'), ...]; sorts on unknown columns are ignored.
+    """
+    columns = {row[1] for row in conn.execute(f"PRAGMA table_info('{table}')")}
+    if not order or any(col not in columns for col, _ in order):
+        return
+    key = sort_key(order)
+    hit_key = (os.path.abspath(db_path), table, key)
+    with _sort_hits_lock:
+        _sort_hits[hit_key] = _sort_hits.get(hit_key, 0) + 1
+        if _sort_hits[hit_key] < AUTO_INDEX_THRESHOLD or hit_key in _auto_indexes_pending:
+            return
+        if has_sort_index(conn, table, key):
+            return
+        _auto_indexes_pending.add(hit_key)
+    _import_executor.submit(create_auto_index, db_path, table, key)
+
+def create_auto_index(db_path, table, key):
+    """Background task: create the index for a popular sort, unless the table's budget is used up"""
+    hit_key = (os.path.abspath(db_path), table, key)
+    try:
+        with get_db_write_lock(db_path):
+            conn = sqlite3.connect(db_path, timeout=SQLITE_TIMEOUT)
+            try:
+                set_web_journal_mode(conn)
+                create_auto_indexes_table(conn)
+                conn.commit()
+                if has_sort_index(conn, table, key):
+                    return
+                existing = conn.execute('SELECT COUNT(*) FROM auto_indexes WHERE table_name = ?', (table,)).fetchone()[0]
+                if existing >= AUTO_INDEX_MAX_PER_TABLE:
+                    print(f"DEBUG: Not indexing {table} {key}: {existing} automatic indexes already")
+                    return
+                name = auto_index_name(table, key)
+                columns = ', '.join(f'"{col}" {direction}' for col, direction in key)
+                started = time.time()
+                with conn:
+                    conn.execute(f'CREATE INDEX IF NOT EXISTS "{name}" ON "{table}" ({columns})')
+                    conn.execute('INSERT OR REPLACE INTO auto_indexes VALUES (?, ?, ?, ?, ?)',
+                                 (name, table, json.dumps(key), _sort_hits.get(hit_key, 0),
+                                  datetime.datetime.now().isoformat(timespec='seconds')))
+                print(f"DEBUG: Created index {name} on {table} ({columns}) in {time.time() - started:.2f}s")
+            finally:
+                conn.close()
+    except Exception as e:
+        print(f"DEBUG: Could not create index for {table} {key}: {e}")
+    finally:
+        with _sort_hits_lock:
+            _auto_indexes_pending.discard(hit_key)
+
+def predict_column_type(values, column_name):
+    """Predict the type of a column from a sample of its values.
+
+    The column name decides first (date and currency keywords, confirmed by
+    the values for dates), then the value range of numeric columns; anything
+    else gets the SQLite type of its dtype.
+    """
+    present = values.dropna()
+    if present.empty:
         return 'TEXT'  # Default for empty columns
-    
-    # Check for date patterns first (before currency)
-    date_keywords = ['date', 'time', 'created', 'modified', 'updated', 'start', 'end', 
-                    'due', 'deadline', 'birth', 'anniversary', 'expiry', 'valid', 'period',
-                    'datum', 'erstellt', 'geändert', 'schluss', 'phase']
     col_lower = column_name.lower()
-    if any(keyword in col_lower for keyword in date_keywords):
-        # Test if the data actually looks like dates
+    # Dates first: date columns often hold Excel serial numbers that would pass as currency
+    if any(keyword in col_lower for keyword in DATE_KEYWORDS):
         try:
-            sample_data = col_data.head(10)
-            # Try German date format first
-            parsed_dates = pd.to_datetime(sample_data, format='%d.%m.%Y', errors='coerce')
-            if parsed_dates.notna().sum() / len(sample_data) > 0.5:
-                return 'DATE'
-            # Try other date formats
-            parsed_dates = pd.to_datetime(sample_data, errors='coerce')
-            if parsed_dates.notna().sum() / len(sample_data) > 0.5:
+            if parse_dates(present).notna().mean() > 0.5:
                 return 'DATE'
-        except:
-            pass
-    
-    # Check for currency patterns
-    if df[column_name].dtype in ['int64', 'float64']:
-        currency_keywords = ['price', 'cost', 'amount', 'value', 'revenue', 'sales', 'budget', 
-                           'fee', 'charge', 'payment', 'total', 'sum', 'money', 'dollar', 'euro', 
-                           'currency', 'cash', 'income', 'expense', 'profit', 'loss', 'revenue',
-                           'betrag', 'preis', 'kosten', 'umsatz']
-        col_lower = column_name.lower()
-        if any(keyword in col_lower for keyword in currency_keywords):
+        except Exception as e:
+            print(f"DEBUG: Could not test {column_name} for dates: {e}")
+    if values.dtype == 'int64':
+        # Whole numbers are only money when the name says so
+        return 'CURRENCY' if any(keyword in col_lower for keyword in CURRENCY_KEYWORDS) else 'INTEGER'
+    if values.dtype == 'float64':
+        if any(keyword in col_lower for keyword in CURRENCY_KEYWORDS):
             return 'CURRENCY'
-        if len(col_data) > 0:
-            min_val = col_data.min()
-            max_val = col_data.max()
-            if 0.01 <= min_val <= 999999 and max_val <= 999999:
-                if df[column_name].dtype == 'float64' or any(val % 1 != 0 for val in col_data if isinstance(val, (int, float))):
-                    return 'CURRENCY'
-    
-    # Check if it's a simple integer column (not date, not currency)
-    if df[column_name].dtype in ['int64']:
-        # If it's a small integer range, it might be an ID or count
-        if len(col_data) > 0:
-            min_val = col_data.min()
-            max_val = col_data.max()
-            if min_val >= 0 and max_val <= 999999:
-                return 'INTEGER'
-    
-    return infer_sqltype(df[column_name].dtype)
+        if 0.01 <= present.min() and present.max() <= 999999:
+            return 'CURRENCY'
+    return infer_sqltype(values.dtype)
+
+def sample_rows(df, max_rows=INFERENCE_SAMPLE_ROWS):
+    """Evenly spaced rows of df, so rows further down count as much as the top"""
+    if len(df) <= max_rows:
+        return df
+    step = len(df) / max_rows
+    return df.iloc[[int(i * step) for i in range(max_rows)]]
+
+def sample_sheet(excel_path, sheet_name, max_rows=INFERENCE_SAMPLE_ROWS):
+    """Evenly spaced rows from the whole of a sheet, streamed through the parsed-sheet cache.
+
+    Every stride-th row is kept; when more than twice max_rows are kept the
+    stride doubles and every other kept row is dropped, so memory stays
+    bounded without knowing the length of the sheet. The parse fills the
+    cache the import then reads from.
+    """
+    kept = []
+    kept_rows = 0
+    stride = 1
+    position = 0
+    for chunk in iter_excel_chunks(excel_path, sheet_name=sheet_name, chunk_size=IMPORT_CHUNK_SIZE):
+        part = chunk.iloc[-position % stride::stride]
+        position += len(chunk)
+        kept.append(part)
+        kept_rows += len(part)
+        if kept_rows > 2 * max_rows:
+            kept = [pd.concat(kept).iloc[::2]]
+            kept_rows = len(kept[0])
+            stride *= 2
+    sample = pd.concat(kept, ignore_index=True) if len(kept) > 1 else kept[0].reset_index(drop=True)
+    # Let pandas pick numeric/datetime dtypes as for the preview
+    return sample_rows(sample, max_rows).infer_objects()
+
+def infer_column_types(excel_path, sheet_name, df):
+    """Predict the type of every column of a sheet, checking user choices first.
+
+    Predictions are made from rows sampled over the whole sheet and cached
+    next to the parsed sheet, so they are only computed again when the Excel
+    file changes.
+    """
+    cache_path = sheet_cache_path(excel_path, sheet_name, kind='types')
+    predicted = next(read_cache_entry(cache_path), {}) if os.path.exists(cache_path) else {}
+    missing = [col for col in df.columns if col not in predicted]
+    if missing:
+        sample = sample_sheet(excel_path, sheet_name)
+        for col in missing:
+            # Columns added to the preview, such as LAB14COMPANY, are not in the sheet
+            values = sample[col] if col in sample.columns else df[col]
+            predicted[col] = predict_column_type(values, col)
+        for _ in write_cache_entry(cache_path, [predicted]):
+            pass
+    return {col: get_user_type_choice(col) or predicted[col] for col in df.columns}
+
+def parse_mapping_form(form, excel_columns, all_table_columns, prefix=''):
+    """Read the column mapping form for one sheet.
+
+    Form fields are named like action_<prefix><column>. Returns the mapping
+    {excel column: table column}, the types of table columns that still have
+    to be created, and an HTML message listing invalid mappings.
+    """
+    mapping = {}
+    new_column_types = {}
+    message = ''
+    # Process all Excel columns (both missing and existing)
+    for col in excel_columns:
+        key = prefix + col
+        action = form.get(f'action_{key}')
+        print(f"DEBUG: Column {col} -> action: {action}")
 
-def predict_column_type(df, column_name, conn=None):
-    """Predict column type, checking user choices first"""
-    user_choice = get_user_type_choice(column_name)
-    if user_choice:
-        return user_choice
-    return _predict_column_type_base(df, column_name)
+        # Check if this column should be existing or new
+        should_be_existing = col in all_table_columns
+        print(f"DEBUG: Column {col} should be existing: {should_be_existing}, but action is: {action}")
+
+        # Auto-correct: If column exists in table but action is 'create', change to map to self
+        if should_be_existing and action == 'create':
+            print(f"DEBUG: Auto-correcting: {col} exists but action is 'create', changing to map to self")
+            action = col
+
+        if action == 'skip':
+            print(f"DEBUG: Skipping column {col}")
+            continue
+        elif action == 'create':
+            # Create new column
+            new_col_name = form.get(f'rename_{key}', col) # Get new name or default
+            col_type = form.get(f'type_{key}', 'TEXT')
+            print(f"DEBUG: Creating column {new_col_name} with type {col_type}")
+
+            # Handle empty column names
+            if not new_col_name or new_col_name.strip() == '':
+                new_col_name = col  # Use original column name as default
+                print(f"DEBUG: Empty column name detected, using original name: {new_col_name}")
+
+            mapping[col] = new_col_name # Map original to new name
+            # Check if column already exists before asking the import job to create it
+            if new_col_name not in all_table_columns:
+                new_column_types[new_col_name] = col_type
+            else:
+                print(f"DEBUG: Column {new_col_name} already exists, mapping {col} to it")
+        elif action == 'map_other':
+            # Map to a different existing column
+            target_col = form.get(f'map_to_{key}')
+            if target_col and target_col in all_table_columns:
+                mapping[col] = target_col
+                print(f"DEBUG: Mapped {col} to existing column {target_col}")
+            else:
+                message += f'Invalid mapping for column {col}<br>'
+                print(f"DEBUG: Invalid mapping for {col} to {target_col}")
+        else:
+            # Map to existing column (action contains the target column name)
+            if action in all_table_columns:
+                mapping[col] = action
+                print(f"DEBUG: Mapped {col} to existing column {action}")
+            else:
+                message += f'Invalid mapping for column {col}<br>'
+                print(f"DEBUG: Invalid mapping for {col} to {action}")
+    return mapping, new_column_types, message
 
 @app.route('/', methods=['GET', 'POST'])
 def index():
@@ -411,20 +2155,29 @@ def table_select():
                 conn = sqlite3.connect(db_path)
                 cur = conn.cursor()
                 cur.execute("SELECT name FROM sqlite_master WHERE type='table'")
-                table_list = [row[0] for row in cur.fetchall()]
+                table_list = [row[0] for row in cur.fetchall() if not is_internal_table(row[0])]
                 conn.close()
             except Exception as e:
                 message = f"Could not read tables: {e}"
     
+    # Sheets of the workbook; several (or all) of them can be imported into the same table
+    sheet_list = []
+    if excel:
+        try:
+            sheet_list = list_excel_sheets(os.path.join(DATA_DIR, excel))
+        except Exception as e:
+            message = f"Could not read sheets: {e}"
+    
     if request.method == 'POST':
         table_choice = request.form.get('table_name')
         new_table = request.form.get('new_table_name')
+        selected_sheets = request.form.getlist('sheet') or sheet_list[:1]
         if not table_choice and not new_table:
             message = 'Please select or enter a table name.'
         else:
             if new_table:
                 table_choice = new_table
-            return redirect(url_for('column_mapping', excel=excel, db=db, table=table_choice, company=company))
+            return redirect(url_for('column_mapping', excel=excel, db=db, table=table_choice, company=company, sheet=selected_sheets))
     
     return render_template_string(STYLE + '''
     <div class="header"><img src="/static/Unknown.png" alt="LAB14 Logo" class="header-logo"><span class="header-title">Excel to SQLite Importer</span><nav class="menu"><a href="/" class="menu-link">Start Over</a><a href="/view_db" class="menu-link">View Database</a></nav></div>
@@ -438,11 +2191,28 @@ def table_select():
             {% endfor %}
         </select>
         or create new table: <input type="text" name="new_table_name"><br>
+        {% if sheet_list|length > 1 %}
+        <h2>Select sheets to import</h2>
+        <p>Each selected sheet gets its own column mapping; all of them are loaded into the same table.</p>
+        <input type="checkbox" id="all_sheets" style="width:auto;"> <label for="all_sheets"><b>All sheets</b></label><br>
+        {% for sh in sheet_list %}
+        <input type="checkbox" name="sheet" value="{{sh}}" id="sheet_{{loop.index}}" style="width:auto;" {% if loop.first %}checked{% endif %}>
+        <label for="sheet_{{loop.index}}">{{sh}}</label><br>
+        {% endfor %}
+        {% endif %}
         <input type="submit" value="Next">
     </form>
     <div class="message">{{message}}</div>
     </div>
-    ''', table_list=table_list, message=message)
+    <script>
+    var allSheets = document.getElementById('all_sheets');
+    if (allSheets) {
+        allSheets.addEventListener('change', function() {
+            document.querySelectorAll('input[name="sheet"]').forEach(function(box) { box.checked = allSheets.checked; });
+        });
+    }
+    </script>
+    ''', table_list=table_list, sheet_list=sheet_list, message=message)
 
 @app.route('/column_mapping', methods=['GET', 'POST'])
 def column_mapping():
@@ -450,17 +2220,27 @@ def column_mapping():
     db = request.args.get('db')
     table = request.args.get('table')
     company = request.args.get('company')
+    sheet_names = request.args.getlist('sheet')
     
     print(f"DEBUG: column_mapping called with:")
     print(f"  excel: {excel}")
     print(f"  db: {db}")
     print(f"  table: {table}")
     print(f"  company: {company}")
+    print(f"  sheets: {sheet_names}")
     
     excel_path = os.path.join(DATA_DIR, excel)
-    df = pd.read_excel(excel_path, sheet_name=0)
-    if company:
-        df['LAB14COMPANY'] = company
+    if not sheet_names:
+        sheet_names = list_excel_sheets(excel_path)[:1]
+    # Only the top of each sheet is needed to build the form; the import streams the rest.
+    # With several sheets every sheet gets its own mapping, told apart by a form field prefix.
+    sheets = []
+    for idx, sheet_name in enumerate(sheet_names):
+        df = read_excel_preview(excel_path, sheet_name=sheet_name)
+        if company:
+            df['LAB14COMPANY'] = company
+        sheets.append({'name': sheet_name, 'df': df, 'prefix': f'sheet{idx}_' if len(sheet_names) > 1 else '',
+                       'inferred_types': infer_column_types(excel_path, sheet_name, df)})
     
     # Ensure database path is correct
     if not os.path.isabs(db):
@@ -484,7 +2264,11 @@ def column_mapping():
     
     # If table does not exist, let user select which columns to use and their types
     if not table_columns:
-        inferred_types = {col: predict_column_type(df, col, conn) for col in df.columns}
+        # Offer the columns of all selected sheets, in order of first appearance
+        inferred_types = {}
+        for sheet in sheets:
+            for col, col_type in sheet['inferred_types'].items():
+                inferred_types.setdefault(col, col_type)
         if request.method == 'POST':
             selected_cols = request.form.getlist('use_col')
             col_defs = []
@@ -510,14 +2294,14 @@ def column_mapping():
                 table_info = [(None, col, None, None, None, None) for col in selected_cols]
                 # After creation, redirect to self to trigger normal mapping flow
                 conn.close()
-                return redirect(url_for('column_mapping', excel=excel, db=db, table=table, company=company))
+                return redirect(url_for('column_mapping', excel=excel, db=db, table=table, company=company, sheet=sheet_names))
         return render_template_string(STYLE + '''
         <div class="header"><img src="/static/Unknown.png" alt="LAB14 Logo" class="header-logo"><span class="header-title">Excel to SQLite Importer</span><nav class="menu"><a href="/" class="menu-link">Start Over</a><a href="/view_db" class="menu-link">View Database</a></nav></div>
         <div class="container">
         <h1>Create Table: {{table}}</h1>
         <form method="post">
             <p>Select which columns from the Excel file to include in the new table and their data types:</p>
-            {% for col in df.columns %}
+            {% for col in inferred_types %}
             <div class="col-map-block">
                 <input type="checkbox" name="use_col" value="{{col}}" id="col_{{loop.index}}" checked>
                 <label for="col_{{loop.index}}"><b>{{col}}</b></label>
@@ -539,7 +2323,7 @@ def column_mapping():
         </form>
         <div class="message">{{message}}</div>
         </div>
-        ''', table=table, df=df, col_types=col_types, message=message, type_choices=type_choices, inferred_types=inferred_types)
+        ''', table=table, col_types=col_types, message=message, type_choices=type_choices, inferred_types=inferred_types)
     
     # Get all existing table columns for reference
     all_table_columns = [col[1] for col in table_info]
@@ -558,280 +2342,96 @@ def column_mapping():
                 col_type = 'DATE'
         existing_column_types[col_name] = col_type
     
-    # Get inferred types for all columns (needed for template)
-    inferred_types = {col: predict_column_type(df, col, conn) for col in df.columns}
-    
     print(f"DEBUG: Template variables:")
-    print(f"  df.columns: {list(df.columns)}")
+    for sheet in sheets:
+        print(f"  {sheet['name']} columns: {list(sheet['df'].columns)}")
     print(f"  all_table_columns: {all_table_columns}")
     print(f"  existing_column_types: {existing_column_types}")
     
     if request.method == 'POST':
         print(f"DEBUG: POST request received")
-        mapping = {}
+        sheet_mappings = []  # (sheet name, {excel column: table column}) per selected sheet
+        new_column_types = {}  # Types chosen on the form for columns created by this import
         message = ''  # Initialize message for POST requests
         
         # Debug: Print what we received
         print(f"DEBUG: Processing POST request for table {table}")
-        print(f"DEBUG: Excel columns: {list(df.columns)}")
         print(f"DEBUG: Table columns: {all_table_columns}")
         print(f"DEBUG: Form data received:")
         for key, value in request.form.items():
             print(f"  {key}: {value}")
         
-        # Check which columns exist in the table
-        print(f"DEBUG: Checking which Excel columns exist in table:")
-        for col in df.columns:
-            exists = col in all_table_columns
-            print(f"  {col}: {'EXISTS' if exists else 'NEW'}")
-        
-        # Process all Excel columns (both missing and existing)
-        for col in df.columns:
-            action = request.form.get(f'action_{col}')
-            print(f"DEBUG: Column {col} -> action: {action}")
-            
-            # Check if this column should be existing or new
-            should_be_existing = col in all_table_columns
-            print(f"DEBUG: Column {col} should be existing: {should_be_existing}, but action is: {action}")
-            
-            # Auto-correct: If column exists in table but action is 'create', change to map to self
-            if should_be_existing and action == 'create':
-                print(f"DEBUG: Auto-correcting: {col} exists but action is 'create', changing to map to self")
-                action = col
-            
-            if action == 'skip':
-                print(f"DEBUG: Skipping column {col}")
-                continue
-            elif action == 'create':
-                # Create new column
-                new_col_name = request.form.get(f'rename_{col}', col) # Get new name or default
-                col_type = request.form.get(f'type_{col}', 'TEXT')
-                print(f"DEBUG: Creating column {new_col_name} with type {col_type}")
-                
-                # Handle empty column names
-                if not new_col_name or new_col_name.strip() == '':
-                    new_col_name = col  # Use original column name as default
-                    print(f"DEBUG: Empty column name detected, using original name: {new_col_name}")
-                
-                sqltype = col_type
-                # Handle CURRENCY and DATE types
-                if sqltype == 'CURRENCY':
-                    sqltype = 'INTEGER'
-                elif sqltype == 'DATE':
-                    sqltype = 'TEXT'  # Store dates as text in SQLite
-                try:
-                    # Check if column already exists before trying to create it
-                    if new_col_name not in all_table_columns:
-                        cur.execute(f'ALTER TABLE "{table}" ADD COLUMN "{new_col_name}" {sqltype}')
-                        conn.commit()
-                        mapping[col] = new_col_name # Map original to new name
-                        # Store metadata for this column
-                        store_column_metadata(conn, table, {new_col_name: col_type})
-                        print(f"DEBUG: Created new column {new_col_name} for {col}")
-                    else:
-                        # Column already exists, just map to it
-                        mapping[col] = new_col_name
-                        print(f"DEBUG: Column {new_col_name} already exists, mapping {col} to it")
-                except Exception as e:
-                    error_msg = f'Failed to add column {new_col_name}: {e}'
-                    message += error_msg + '<br>'
-                    print(f"DEBUG: Failed to create column {new_col_name}: {e}")
-                    # Still add to mapping to allow import to proceed
-                    mapping[col] = new_col_name
-                    print(f"DEBUG: Added {col} to mapping despite error to allow import to proceed")
-            elif action == 'map_other':
-                # Map to a different existing column
-                target_col = request.form.get(f'map_to_{col}')
-                if target_col and target_col in all_table_columns:
-                    mapping[col] = target_col
-                    print(f"DEBUG: Mapped {col} to existing column {target_col}")
-                else:
-                    message += f'Invalid mapping for column {col}<br>'
-                    print(f"DEBUG: Invalid mapping for {col} to {target_col}")
-            else:
-                # Map to existing column (action contains the target column name)
-                if action in all_table_columns:
-                    mapping[col] = action
-                    print(f"DEBUG: Mapped {col} to existing column {action}")
-                else:
-                    message += f'Invalid mapping for column {col}<br>'
-                    print(f"DEBUG: Invalid mapping for {col} to {action}")
+        for sheet in sheets:
+            sheet_mapping, sheet_new_columns, sheet_message = parse_mapping_form(
+                request.form, sheet['df'].columns, all_table_columns, sheet['prefix'])
+            message += sheet_message
+            new_column_types.update(sheet_new_columns)
+            # Drop empty or problematic target column names before streaming the sheet
+            problematic_cols = [c for c, target in sheet_mapping.items()
+                                if not target or target.strip() == '' or target.startswith('Unnamed:')]
+            if problematic_cols:
+                print(f"DEBUG: Found problematic columns in {sheet['name']}: {problematic_cols}")
+                for col in problematic_cols:
+                    del sheet_mapping[col]
+            if sheet_mapping:
+                sheet_mappings.append((sheet['name'], sheet_mapping))
         
-        print(f"DEBUG: Final mapping: {mapping}")
+        print(f"DEBUG: Final mappings: {sheet_mappings}")
         print(f"DEBUG: Message: {message}")
         
         # Only proceed if we have mappings (even if there are some errors)
-        if mapping:
-            print(f"DEBUG: Proceeding with import - mapping has {len(mapping)} columns")
-            # Prepare DataFrame for import
-            import_df = df.copy()
-            import_df = import_df[[c for c in mapping.keys()]]
-            import_df = import_df.rename(columns=mapping)
-            
-            # Clean up column names - remove empty or problematic names
-            problematic_cols = []
-            for col in import_df.columns:
-                if not col or col.strip() == '' or col.startswith('Unnamed:'):
-                    problematic_cols.append(col)
-            
-            if problematic_cols:
-                print(f"DEBUG: Found problematic columns: {problematic_cols}")
-                # Remove problematic columns
-                import_df = import_df.drop(columns=problematic_cols)
-                print(f"DEBUG: Removed problematic columns, remaining: {list(import_df.columns)}")
+        if sheet_mappings:
+            print(f"DEBUG: Proceeding with import of {len(sheet_mappings)} sheet(s)")
             
             # Validate that we have data to import
-            if import_df.empty:
-                message = 'No data to import after column mapping.'
-                print(f"DEBUG: DataFrame is empty after mapping")
-            elif not table or table.strip() == '':
+            if not table or table.strip() == '':
                 message = 'Invalid table name specified.'
                 print(f"DEBUG: Table name is empty or invalid: '{table}'")
             else:
-                print(f"DEBUG: About to import {len(import_df)} rows to table '{table}'")
-                print(f"DEBUG: Import columns: {list(import_df.columns)}")
-                
-                # Handle currency conversion for import
-                column_types_to_store = {}  # Track all column types for metadata storage
-                
-                for col in import_df.columns:
-                    # Determine if this is an existing column or a new one
-                    is_existing_column = col in all_table_columns
-                    
-                    if is_existing_column:
-                        # For existing columns, use the existing type from the database
-                        col_type = existing_column_types[col]
-                        # Store metadata for existing columns to ensure consistency
-                        column_types_to_store[col] = col_type
+                # Resolve the type of every target column: existing columns keep the
+                # type from the database, new columns use the type chosen on the form
+                column_types_to_store = {}
+                for target in (t for _, sheet_mapping in sheet_mappings for t in sheet_mapping.values()):
+                    if target in new_column_types:
+                        column_types_to_store[target] = new_column_types[target]
                     else:
-                        # For new columns, get the type from the form
-                        col_type = request.form.get(f'type_{col}', 'TEXT')
-                        # Get the new column name (if renamed)
-                        new_col_name = request.form.get(f'rename_{col}', col)
-                        # Store metadata using the new column name
-                        column_types_to_store[new_col_name] = col_type
-                    
-                    print(f"DEBUG: Processing column {col} with type {col_type}")
-                    
-                    # Handle currency conversion based on column type (not just metadata)
-                    if col_type == 'CURRENCY':
-                        # Convert to pennies/cents (multiply by 100 and round to integer)
-                        print(f"DEBUG: Converting {col} to currency (pennies)")
-                        original_values = import_df[col].copy()
-                        # Handle NaN values - only convert non-NaN values
-                        import_df[col] = pd.to_numeric(import_df[col], errors='coerce')
-                        # Only multiply non-NaN values by 100
-                        mask = import_df[col].notna()
-                        import_df.loc[mask, col] = import_df.loc[mask, col].round(2) * 100
-                        # Convert to integer more safely
-                        try:
-                            import_df[col] = import_df[col].astype('Int64')  # Use nullable integer type
-                        except TypeError:
-                            # If Int64 fails, try regular int64 and handle NaN values
-                            import_df[col] = import_df[col].fillna(0).astype('int64')
-                        print(f"DEBUG: Currency conversion - Original: {original_values.head()}, Converted: {import_df[col].head()}")
-                    elif col_type == 'INTEGER':
-                        # Convert to integer, handling NaN values
-                        print(f"DEBUG: Converting {col} to integer")
-                        original_values = import_df[col].copy()
-                        import_df[col] = pd.to_numeric(import_df[col], errors='coerce')
-                        # Convert to integer more safely
-                        try:
-                            import_df[col] = import_df[col].astype('Int64')  # Use nullable integer type
-                        except TypeError:
-                            # If Int64 fails, try regular int64 and handle NaN values
-                            import_df[col] = import_df[col].fillna(0).astype('int64')
-                        print(f"DEBUG: Integer conversion - Original: {original_values.head()}, Converted: {import_df[col].head()}")
-                    elif col_type == 'DATE':
-                        # Convert to ISO format string
-                        print(f"DEBUG: Converting {col} to date format")
-                        original_values = import_df[col].copy()
-                        # Try German date format first (dd.mm.yyyy), then other formats
-                        import_df[col] = pd.to_datetime(import_df[col], format='%d.%m.%Y', errors='coerce')
-                        # If that fails, try other common formats
-                        if import_df[col].isna().all():
-                            import_df[col] = pd.to_datetime(original_values, errors='coerce')
-                        import_df[col] = import_df[col].dt.strftime('%Y-%m-%d')
-                        print(f"DEBUG: Date conversion - Original: {original_values.head()}, Converted: {import_df[col].head()}")
-                    elif col_type == 'REAL':
-                        # Convert to float, handling NaN values
-                        print(f"DEBUG: Converting {col} to real/float")
-                        original_values = import_df[col].copy()
-                        import_df[col] = pd.to_numeric(import_df[col], errors='coerce')
-                        print(f"DEBUG: Real conversion - Original: {original_values.head()}, Converted: {import_df[col].head()}")
+                        column_types_to_store[target] = existing_column_types.get(target, 'TEXT')
+                print(f"DEBUG: Import column types: {column_types_to_store}")
                 
-                print(f"DEBUG: DataFrame after type conversions:")
-                print(f"  Shape: {import_df.shape}")
-                print(f"  Sample data:")
-                print(import_df.head())
+                profile_name = request.form.get('save_profile', '').strip()
+                if profile_name:
+                    profile_path = save_mapping_profile(profile_name, table, sheet_mappings, column_types_to_store)
+                    print(f"DEBUG: Saved mapping profile to {profile_path}")
                 
-                # Import the data
-                try:
-                    print(f"DEBUG: DataFrame before import:")
-                    print(f"  Shape: {import_df.shape}")
-                    print(f"  Columns: {list(import_df.columns)}")
-                    print(f"  First few rows:")
-                    print(import_df.head())
-                    
-                    # Check table structure before import
-                    cur = conn.cursor()
-                    cur.execute(f"PRAGMA table_info('{table}')")
-                    table_info = cur.fetchall()
-                    print(f"DEBUG: Table structure before import:")
-                    for col_info in table_info:
-                        print(f"  {col_info[1]} ({col_info[2]})")
-                    
-                    # Get row count before import
-                    cur.execute(f"SELECT COUNT(*) FROM {table}")
-                    count_before = cur.fetchone()[0]
-                    print(f"DEBUG: Row count before import: {count_before}")
-                    
-                    # Try the import
-                    import_df.to_sql(table, conn, if_exists='append', index=False)
-                    conn.commit()
-                    
-                    # Get row count after import
-                    cur.execute(f"SELECT COUNT(*) FROM {table}")
-                    count_after = cur.fetchone()[0]
-                    print(f"DEBUG: Row count after import: {count_after}")
-                    print(f"DEBUG: Rows added: {count_after - count_before}")
-                    
-                    # Check if any data was actually inserted
-                    if count_after == count_before:
-                        print(f"DEBUG: WARNING - No rows were actually inserted!")
-                        # Try to get a sample of the data to see what's wrong
-                        cur.execute(f"SELECT * FROM {table} LIMIT 5")
-                        sample_data = cur.fetchall()
-                        print(f"DEBUG: Sample data from table: {sample_data}")
-                    
-                    # Store column metadata for ALL columns (both new and existing)
-                    store_column_metadata(conn, table, column_types_to_store)
-                    # Store user data type choices for future prediction
-                    for col, col_type in column_types_to_store.items():
-                        store_user_type_choice(col, col_type)
-                    
-                    # Show success message with any warnings
-                    if message:
-                        message = f'Successfully imported {len(import_df)} rows to table "{table}". Some columns could not be created: {message}'
-                    else:
-                        message = f'Successfully imported {len(import_df)} rows to table "{table}"'
-                    
-                    conn.close()
-                    return redirect(url_for('view_db'))
-                except Exception as e:
-                    message = f'Import failed: {e}'
-                    print(f"DEBUG: Import exception: {e}")
+                # Hand the import to the background worker pool and show its progress page
+                job = ImportJob(excel, db_path, table)
+                if message:
+                    job.warnings.append(message)
+                import_mode = request.form.get('import_mode', 'append')
+                key_columns = [col for col in request.form.getlist('key_column') if col in column_types_to_store]
+                ledger_key = import_ledger_key(excel_path, [name for name, _ in sheet_mappings],
+                                               {'mappings': sheet_mappings, 'types': column_types_to_store,
+                                                'company': company})
+                previous = find_import(conn, table, ledger_key)
+                if previous and not request.form.get('force_import'):
+                    message = (f'{excel} was already imported into table "{table}" with this mapping on '
+                               f'{previous["imported_at"]} ({previous["rows"]} rows). '
+                               f'Tick "Import again" to import it anyway.')
+                elif submit_import_job(job, run_import, excel_path, db_path, table, sheet_mappings,
+                                       column_types_to_store, new_columns=new_column_types,
+                                       company=company, mode=import_mode, key_columns=key_columns,
+                                       ledger_key=ledger_key):
                     conn.close()
-        elif not mapping:
-            message = 'No columns were selected for import.'
-            print(f"DEBUG: No columns were mapped")
+                    return redirect(url_for('import_status', job_id=job.id))
+                else:
+                    message = f'Too many imports are running (limit {MAX_ACTIVE_JOBS}). Please try again shortly.'
         else:
-            print(f"DEBUG: Import blocked due to errors: {message}")
+            message += 'No columns were selected for import.'
+            print(f"DEBUG: No columns were mapped")
         # If there are errors, continue to show the form with error messages
     
     # Prepare template variables
     type_choices = ['TEXT', 'INTEGER', 'REAL', 'CURRENCY', 'DATE']
-    inferred_types = {col: predict_column_type(df, col, conn) for col in df.columns}
     
     return render_template_string(STYLE + '''
     <div class="header"><img src="/static/Unknown.png" alt="LAB14 Logo" class="header-logo"><span class="header-title">Excel to SQLite Importer</span><nav class="menu"><a href="/" class="menu-link">Start Over</a><a href="/view_db" class="menu-link">View Database</a></nav></div>
@@ -841,19 +2441,23 @@ def column_mapping():
         <h2>Map Excel Columns to Database</h2>
         <p>For each Excel column, choose how to handle it:</p>
         
-        {% for col in df.columns %}
+        {% for sheet in sheets %}
+        {% if sheets|length > 1 %}<h2>Sheet: {{sheet.name}}</h2>{% endif %}
+        {% set inferred_types = sheet.inferred_types %}
+        {% for col in sheet.df.columns %}
+        {% set key = sheet.prefix ~ col %}
         <div class="col-map-block">
             <b>{{col}}</b><br>
             
             {% if col in all_table_columns %}
             <!-- For existing columns, default to mapping to the same column -->
-            <input type="radio" name="action_{{col}}" value="{{col}}" id="map_{{col}}" checked>
-            <label for="map_{{col}}">Map to existing column: <strong>{{col}}</strong> ({{existing_column_types[col]}})</label><br>
+            <input type="radio" name="action_{{key}}" value="{{col}}" id="map_{{key}}" checked>
+            <label for="map_{{key}}">Map to existing column: <strong>{{col}}</strong> ({{existing_column_types[col]}})</label><br>
             
             <!-- Map to other existing column option -->
-            <input type="radio" name="action_{{col}}" value="map_other" id="map_other_{{col}}">
-            <label for="map_other_{{col}}">Map to other existing column:</label>
-            <select name="map_to_{{col}}" disabled>
+            <input type="radio" name="action_{{key}}" value="map_other" id="map_other_{{key}}">
+            <label for="map_other_{{key}}">Map to other existing column:</label>
+            <select name="map_to_{{key}}" disabled>
                 <option value="">-- Select column --</option>
                 {% for table_col in all_table_columns %}
                 {% if table_col != col %}
@@ -863,10 +2467,10 @@ def column_mapping():
             </select><br>
             
             <!-- Create new column option (disabled by default for existing columns) -->
-            <input type="radio" name="action_{{col}}" value="create" id="create_{{col}}">
-            <label for="create_{{col}}">Create new column</label>
-            <input type="text" name="rename_{{col}}" placeholder="New column name (optional)" style="width: 200px; margin-left: 10px;" disabled>
-            <select name="type_{{col}}" disabled>
+            <input type="radio" name="action_{{key}}" value="create" id="create_{{key}}">
+            <label for="create_{{key}}">Create new column</label>
+            <input type="text" name="rename_{{key}}" placeholder="New column name (optional)" style="width: 200px; margin-left: 10px;" disabled>
+            <select name="type_{{key}}" disabled>
                 {% for t in type_choices %}
                 <option value="{{t}}" {% if t == existing_column_types[col] %}selected{% endif %}>{{t}}</option>
                 {% endfor %}
@@ -875,10 +2479,10 @@ def column_mapping():
             
             {% else %}
             <!-- For new columns, default to creating new column -->
-            <input type="radio" name="action_{{col}}" value="create" id="create_{{col}}" checked>
-            <label for="create_{{col}}">Create new column</label>
-            <input type="text" name="rename_{{col}}" placeholder="New column name (optional)" style="width: 200px; margin-left: 10px;">
-            <select name="type_{{col}}">
+            <input type="radio" name="action_{{key}}" value="create" id="create_{{key}}" checked>
+            <label for="create_{{key}}">Create new column</label>
+            <input type="text" name="rename_{{key}}" placeholder="New column name (optional)" style="width: 200px; margin-left: 10px;">
+            <select name="type_{{key}}">
                 {% for t in type_choices %}
                 <option value="{{t}}" {% if t == inferred_types[col] %}selected{% endif %}>{{t}}</option>
                 {% endfor %}
@@ -886,9 +2490,9 @@ def column_mapping():
             
             <!-- Map to existing column option (only if there are existing columns) -->
             {% if all_table_columns %}
-            <input type="radio" name="action_{{col}}" value="map_other" id="map_other_{{col}}">
-            <label for="map_other_{{col}}">Map to existing column:</label>
-            <select name="map_to_{{col}}" disabled>
+            <input type="radio" name="action_{{key}}" value="map_other" id="map_other_{{key}}">
+            <label for="map_other_{{key}}">Map to existing column:</label>
+            <select name="map_to_{{key}}" disabled>
                 <option value="">-- Select column --</option>
                 {% for table_col in all_table_columns %}
                 <option value="{{table_col}}">{{table_col}} ({{existing_column_types[table_col]}})</option>
@@ -899,8 +2503,8 @@ def column_mapping():
             {% endif %}
             
             <!-- Skip option for all columns -->
-            <input type="radio" name="action_{{col}}" value="skip" id="skip_{{col}}">
-            <label for="skip_{{col}}">Skip this column</label><br>
+            <input type="radio" name="action_{{key}}" value="skip" id="skip_{{key}}">
+            <label for="skip_{{key}}">Skip this column</label><br>
             
             {% if inferred_types[col] in ['CURRENCY', 'DATE'] %}
             <div style="margin-top:5px;font-size:0.9em;color:#007acc;">
@@ -909,7 +2513,22 @@ def column_mapping():
             {% endif %}
         </div>
         {% endfor %}
+        {% endfor %}
         
+        <p>Import mode:
+            <label><input type="radio" name="import_mode" value="append" checked> Append all rows</label>
+            <label><input type="radio" name="import_mode" value="incremental"> Only new or changed rows</label>
+            <label><input type="radio" name="import_mode" value="replace"> Replace all rows</label></p>
+        {% if all_table_columns %}
+        <p>Key columns for "only new or changed rows" (optional; a row with a known key updates the existing row):<br>
+            {% for col in all_table_columns %}
+            <label style="margin-right:10px;"><input type="checkbox" name="key_column" value="{{col}}"> {{col}}</label>
+            {% endfor %}</p>
+        {% endif %}
+        <p><label><input type="checkbox" name="force_import" value="1">
+            Import again, even if this file was already imported with this mapping</label></p>
+        <p>Save this mapping as a profile for batch imports (optional):
+            <input type="text" name="save_profile" placeholder="Profile name" style="width: 300px;"></p>
         <input type="submit" value="Import Data">
     </form>
     <div class="message">{{message}}</div>
@@ -918,7 +2537,7 @@ def column_mapping():
     <script>
     // Enable/disable form elements based on radio button selection
     document.addEventListener('DOMContentLoaded', function() {
-        const excelColumns = {{df.columns.tolist() | tojson}};
+        const excelColumns = {{form_keys | tojson}};
         const tableColumns = {{all_table_columns | tojson}};
         
         excelColumns.forEach(function(col) {
@@ -958,9 +2577,70 @@ def column_mapping():
         });
     });
     </script>
-    ''', table=table, df=df, all_table_columns=all_table_columns, 
+    ''', table=table, sheets=sheets, all_table_columns=all_table_columns, 
          existing_column_types=existing_column_types, message=message, 
-         type_choices=type_choices, inferred_types=inferred_types) 
+         type_choices=type_choices,
+         form_keys=[sheet['prefix'] + col for sheet in sheets for col in sheet['df'].columns]) 
+
+@app.route('/jobs/<job_id>', methods=['GET'])
+def job_status(job_id):
+    job = get_import_job(job_id)
+    if not job:
+        return jsonify({'error': f'Unknown job {job_id}'}), 404
+    return jsonify(job.to_dict())
+
+@app.route('/import_status/<job_id>', methods=['GET'])
+def import_status(job_id):
+    job = get_import_job(job_id)
+    if not job:
+        return f"Import job {job_id} not found.", 404
+    return render_template_string(STYLE + '''
+    <div class="header"><img src="/static/Unknown.png" alt="LAB14 Logo" class="header-logo"><span class="header-title">Excel to SQLite Importer</span><nav class="menu"><a href="/" class="menu-link">Start Over</a><a href="/view_db" class="menu-link">View Database</a></nav></div>
+    <div class="container">
+    <h1>Importing {{job.source}} into {{job.table}}</h1>
+    <table>
+        <tr><th>Job</th><td>{{job.id}}</td></tr>
+        <tr><th>Stage</th><td id="stage">{{job.stage}}</td></tr>
+        <tr><th>Rows processed</th><td id="rows">{{job.rows_processed}}</td></tr>
+        <tr><th>Rows/sec</th><td id="rate">{{job.rows_per_sec()}}</td></tr>
+    </table>
+    <div id="result" class="message" style="display:none;"></div>
+    <div id="warnings" class="message error" style="display:none;"></div>
+    <div class="export-buttons"><a href="/view_db">View Database</a></div>
+    </div>
+    <script>
+    function poll() {
+        fetch({{ url_for('job_status', job_id=job.id) | tojson }})
+            .then(function(r) { return r.json(); })
+            .then(function(job) {
+                document.getElementById('stage').textContent = job.stage;
+                document.getElementById('rows').textContent = job.rows_processed;
+                document.getElementById('rate').textContent = job.rows_per_sec;
+                var problems = job.errors.concat(job.warnings);
+                if (problems.length) {
+                    var warnings = document.getElementById('warnings');
+                    warnings.style.display = 'block';
+                    warnings.textContent = '';
+                    problems.forEach(function(p) {
+                        var line = document.createElement('div');
+                        line.textContent = p;
+                        warnings.appendChild(line);
+                    });
+                }
+                if (job.finished) {
+                    if (job.message) {
+                        var result = document.getElementById('result');
+                        result.style.display = 'block';
+                        result.textContent = job.message;
+                    }
+                } else {
+                    setTimeout(poll, 1000);
+                }
+            });
+    }
+    poll();
+    </script>
+    ''', job=job)
 
 @app.route('/view_db', methods=['GET'])
 def view_db():
@@ -979,12 +2659,22 @@ def view_db():
     
     # Get all table names
     cur.execute("SELECT name FROM sqlite_master WHERE type='table'")
-    tables = [row[0] for row in cur.fetchall()]
+    tables = [row[0] for row in cur.fetchall() if not is_internal_table(row[0])]
     
     # Get column metadata for each table
-    table_metadata = {}
+    all_metadata = get_all_column_metadata(conn)
+    table_metadata = {table_name: all_metadata.get(table_name, {}) for table_name in tables}
+    
+    # Statistics kept by the importer, so no table has to be scanned here
+    all_stats = load_column_stats(conn)
+    table_rows = {}
+    column_summaries = {}
     for table_name in tables:
-        table_metadata[table_name] = get_column_metadata(conn, table_name)
+        stats = all_stats.get(table_name, {})
+        if stats:
+            table_rows[table_name] = max(col_stats['rows'] for col_stats in stats.values())
+        for col, col_stats in stats.items():
+            column_summaries[(table_name, col)] = column_stats_summary(col_stats, table_metadata[table_name].get(col))
     
     conn.close()
     
@@ -994,6 +2684,8 @@ def view_db():
     <h1>Database: {{db_file}}</h1>
     <div class="export-buttons">
         <a href="{{ url_for('export_db', db_file=db_file) }}">Export Entire Database</a>
+        <a href="{{ url_for('export_db', db_file=db_file, gzip=1) }}">Export Entire Database (gzip)</a>
+        <a href="{{ url_for('auto_indexes', db_file=db_file) }}">Sort Indexes</a>
     </div>
     <h2>Tables</h2>
     <table>
@@ -1007,12 +2699,13 @@ def view_db():
         <tbody>
             {% for table_name, metadata in table_metadata.items() %}
             <tr>
-                <td>{{ table_name }}</td>
+                <td>{{ table_name }}{% if table_name in table_rows %}<br><small>{{ table_rows[table_name] }} rows</small>{% endif %}</td>
                 <td>
                     <ul>
                         {% for col, info in metadata.items() %}
                         <li>
                             {{ col }} ({{ info['type'] }}) - {% if info['is_currency'] %}Currency{% endif %} - {% if info['is_date'] %}Date{% endif %}
+                            {% if (table_name, col) in column_summaries %}<br><small>{{ column_summaries[(table_name, col)] }}</small>{% endif %}
                             <a href="{{ url_for('edit_column', db_file=db_file, table_name=table_name, column_name=col) }}" style="margin-left: 10px; font-size: 0.8em; color: #007acc;">[Edit]</a>
                         </li>
                         {% endfor %}
@@ -1028,7 +2721,508 @@ def view_db():
         </tbody>
     </table>
     </div>
-    ''', db_file=db_file, table_metadata=table_metadata)
+    ''', db_file=db_file, table_metadata=table_metadata, table_rows=table_rows,
+       column_summaries=column_summaries)
+
+def _cache_for_token(cache, token, key, value):
+    """Store value under (token, *key), dropping entries of older versions of the same database"""
+    for old in [old for old in cache if old[0][0] == token[0] and old[0] != token]:
+        del cache[old]
+    while len(cache) >= VIEW_CACHE_ENTRIES:
+        del cache[next(iter(cache))]
+    cache[(token,) + key] = value
+
+def _result_size(value):
+    """Approximate bytes held by a cached result"""
+    if isinstance(value, pd.DataFrame):
+        return int(value.memory_usage(index=True, deep=True).sum())
+    if isinstance(value, (tuple, list)):
+        return sys.getsizeof(value) + sum(_result_size(item) for item in value)
+    return sys.getsizeof(value)
+
+def _drop_result(key):
+    global _result_cache_bytes
+    _result_cache_bytes -= _result_cache.pop(key)[2]
+
+def cached_result(db_path, table, key, compute):
+    """Return compute(), cached under (db_path, table, key) while the database is unchanged.
+
+    Entries are checked against db_state_token (file and PRAGMA data_version)
+    and the least recently used ones are evicted once the cache holds more than
+    RESULT_CACHE_MAX_BYTES. Cached values are shared, callers must not modify them.
+    """
+    global _result_cache_bytes
+    token = db_state_token(db_path)
+    if token is None:
+        return compute()
+    cache_key = (token[0], table, key)
+    with _result_cache_lock:
+        entry = _result_cache.get(cache_key)
+        if entry is not None and entry[0] == token:
+            _result_cache.move_to_end(cache_key)
+            _result_cache_stats['hits'] += 1
+            return entry[1]
+        _result_cache_stats['misses'] += 1
+    value = compute()
+    size = _result_size(value)
+    if size > RESULT_CACHE_MAX_BYTES:
+        return value
+    with _result_cache_lock:
+        if cache_key in _result_cache:
+            _drop_result(cache_key)
+        _result_cache[cache_key] = (token, value, size)
+        _result_cache_bytes += size
+        while _result_cache_bytes > RESULT_CACHE_MAX_BYTES:
+            _drop_result(next(iter(_result_cache)))
+            _result_cache_stats['evictions'] += 1
+    return value
+
+def invalidate_result_cache(db_path, table=None):
+    """Drop the cached results of a table, or of the whole database, after the app changed it"""
+    path = os.path.abspath(db_path)
+    with _result_cache_lock:
+        for key in [key for key in _result_cache if key[0] == path and table in (None, key[1])]:
+            _drop_result(key)
+            _result_cache_stats['invalidations'] += 1
+
+def result_cache_stats():
+    with _result_cache_lock:
+        return dict(_result_cache_stats, entries=len(_result_cache), bytes=_result_cache_bytes,
+                    max_bytes=RESULT_CACHE_MAX_BYTES)
+
+@app.route('/result_cache')
+def result_cache():
+    """Hit/miss counters and size of the result cache as JSON"""
+    return jsonify(result_cache_stats())
+
+def table_row_count(conn, db_path, table, where='', params=()):
+    """COUNT(*) of a table, optionally filtered by a WHERE clause, cached until the database changes"""
+    token = db_state_token(db_path)
+    key = (table, where, tuple(params))
+    with _row_count_cache_lock:
+        if token is not None and (token,) + key in _row_count_cache:
+            return _row_count_cache[(token,) + key]
+    count = conn.execute(f'SELECT COUNT(*) FROM "{table}"' + (f' WHERE {where}' if where else ''),
+                         params).fetchone()[0]
+    if token is not None:
+        with _row_count_cache_lock:
+            _cache_for_token(_row_count_cache, token, key, count)
+    return count
+
+def encode_cursor(values):
+    """Turn the sort values of the last row shown into an URL-safe keyset cursor"""
+    return base64.urlsafe_b64encode(json.dumps(values).encode('utf-8')).decode('ascii')
+
+def decode_cursor(cursor):
+    return json.loads(base64.urlsafe_b64decode(cursor.encode('ascii')))
+
+def keyset_predicate(order, values):
+    """WHERE clause selecting the rows after values in the sort order, NULL-safe.
+
+    order is [(column, 'ASC'|'DESC'), ...] ending with the rowid tie-breaker
+    and values the cursor's value for each of them. SQLite sorts NULL first
+    ascending and last descending, so "after NULL" and "after x" differ per
+    direction. Returns (sql, params).
+    """
+    if all(direction == 'ASC' for _, direction in order) and None not in values:
+        # Row values can use an index on the sort columns directly
+        columns = ', '.join(col for col, _ in order)
+        return f'({columns}) > ({", ".join("?" for _ in values)})', list(values)
+    terms = []
+    params = []
+    for i, ((col, direction), value) in enumerate(zip(order, values)):
+        equal = [f'{prev_col} IS ?' for prev_col, _ in order[:i]]
+        if direction == 'ASC':
+            after = f'{col} IS NOT NULL' if value is None else f'{col} > ?'
+        elif value is None:
+            continue  # Nothing sorts after NULL descending
+        else:
+            after = f'({col} < ? OR {col} IS NULL)'
+        terms.append('(' + ' AND '.join(equal + [after]) + ')')
+        params.extend(list(values[:i]) + ([] if value is None else [value]))
+    return ' OR '.join(terms) or '0', params
+
+def formatted_column_sql(table, col, info, mode='display'):
+    """SQL expression formatting a column for display or export, aliased to the column name.
+
+    Currency is stored in cents: 'display' shows it as $x.xx (empty for zero),
+    'export' and 'excel' as a number of dollars. Dates are shown as MM/DD/YYYY,
+    except in 'excel' where they become Excel serial dates to be formatted by
+    the worksheet. Columns are qualified with the table, so ORDER BY and WHERE
+    still see the stored values and not the formatted aliases.
+    """
+    column = f'"{table}"."{col}"'
+    if info and info['is_currency']:
+        if mode == 'display':
+            column = (f"CASE WHEN typeof({column}) IN ('integer', 'real') AND {column} != 0 "
+                      f"THEN printf('$%.2f', {column} / 100.0) ELSE '' END")
+        else:
+            column = f'ROUND({column} / 100.0, 2)'
+    elif info and info['is_date'] and mode == 'excel':
+        # Days since 1899-12-30 (julianday 2415018.5), the time of day as fraction
+        column = f'julianday({column}) - 2415018.5'
+    elif info and info['is_date']:
+        column = f"strftime('%m/%d/%Y', {column})"
+    return f'{column} AS "{col}"'
+
+def formatted_select(table, columns, metadata, mode='display'):
+    """SELECT list returning columns of table formatted for display or export"""
+    return ', '.join(formatted_column_sql(table, col, metadata.get(col), mode) for col in columns)
+
+def search_condition(table, columns, metadata, value):
+    """WHERE clause matching rows where any of columns contains value as displayed. Returns (sql, params)."""
+    pattern = '%' + re.sub(r'([\\%_])', r'\\\1', value) + '%'
+    terms = []
+    for col in columns:
+        expression = formatted_column_sql(table, col, metadata.get(col)).rsplit(' AS ', 1)[0]
+        terms.append(f"{expression} LIKE ? ESCAPE '\\'")
+    return ' OR '.join(terms), [pattern] * len(terms)
+
+def filter_value(value, info):
+    """Convert a filter value as typed on view_table to what the column stores; raises ValueError.
+
+    Currency becomes cents and numbers may use $, thousands separators and
+    k/m suffixes ("50k"). Dates are read like imported dates and returned
+    as a Timestamp. Anything else is compared as typed.
+    """
+    if info and (info['is_currency'] or info['type'] in ('INTEGER', 'REAL')):
+        text = value.strip().replace('$', '').replace(',', '').replace(' ', '').lower()
+        multiplier = {'k': 1000, 'm': 1000000}.get(text[-1:], 1)
+        try:
+            number = float(text[:-1] if multiplier > 1 else text) * multiplier
+        except ValueError:
+            raise ValueError(f'"{value}" is not a number') from None
+        if info['is_currency']:
+            return int(round(number * 100))
+        return int(number) if info['type'] == 'INTEGER' and number.is_integer() else number
+    if info and info['is_date']:
+        date = parse_dates(pd.Series([value.strip()], dtype=object)).iloc[0]
+        if pd.isna(date):
+            raise ValueError(f'"{value}" is not a date')
+        return date.normalize()
+    return value
+
+def compile_filters(table, filters, metadata):
+    """Compile [(column, operator, value), ...] into a parameterized WHERE clause, typed by column_metadata.
+
+    Returns (sql, params, errors); filters whose value does not fit the
+    column's type are left out and described in errors. Comparisons are on
+    the stored values, so indexes on the columns can be used.
+    """
+    conditions = []
+    params = []
+    errors = []
+    for col, op, value in filters:
+        column = f'"{table}"."{col}"'
+        info = metadata.get(col)
+        if op == 'empty':
+            conditions.append(f"{column} IS NULL OR {column} = ''")
+            continue
+        if op == 'notempty':
+            conditions.append(f"{column} IS NOT NULL AND {column} != ''")
+            continue
+        if op == 'contains':
+            condition, condition_params = search_condition(table, [col], metadata, value)
+            conditions.append(condition)
+            params.extend(condition_params)
+            continue
+        try:
+            typed = filter_value(value, info)
+        except ValueError as e:
+            errors.append(f'{col}: {e}')
+            continue
+        if isinstance(typed, pd.Timestamp):
+            # Stored dates may carry a time of day, so a day is the ISO range [day, next day)
+            day = typed.strftime('%Y-%m-%d')
+            next_day = (typed + pd.Timedelta(days=1)).strftime('%Y-%m-%d')
+            condition, values = {
+                'eq': (f'{column} >= ? AND {column} < ?', [day, next_day]),
+                'ne': (f'{column} < ? OR {column} >= ?', [day, next_day]),
+                'lt': (f'{column} < ?', [day]),
+                'le': (f'{column} < ?', [next_day]),
+                'gt': (f'{column} >= ?', [next_day]),
+                'ge': (f'{column} >= ?', [day]),
+            }[op]
+        else:
+            condition, values = f'{column} {FILTER_OPERATORS[op]} ?', [typed]
+        conditions.append(condition)
+        params.extend(values)
+    return ' AND '.join(f'({condition})' for condition in conditions), params, errors
+
+def request_filters(args, columns):
+    """Filters of a request as [(column, operator, value), ...] from the parallel fcol/fop/fval lists"""
+    filters = []
+    for col, op, value in zip(args.getlist('fcol'), args.getlist('fop'), args.getlist('fval')):
+        if col not in columns or op not in FILTER_OPERATORS:
+            continue
+        if value.strip() or op in ('empty', 'notempty'):
+            filters.append((col, op, value.strip()))
+    return filters
+
+def filter_args(filters):
+    """URL arguments reproducing filters"""
+    return {'fcol': [col for col, _, _ in filters], 'fop': [op for _, op, _ in filters],
+            'fval': [value for _, _, value in filters]}
+
+def record_filter(conn, db_path, table, filters, metadata):
+    """Count a filter with the index advisor: equality columns first, then one range column, like a sort"""
+    ranges = ('lt', 'le', 'gt', 'ge', 'eq')
+    equal = [col for col, op, _ in filters if op == 'eq' and not (metadata.get(col) or {}).get('is_date')]
+    ranged = [col for col, op, _ in filters if op in ranges and col not in equal]
+    columns = list(dict.fromkeys(equal + ranged[:1]))
+    if columns:
+        record_sort(conn, db_path, table, [(col, 'ASC') for col in columns])
+
+def fetch_page(conn, table, order, page_size, cursor=None, offset=0, where='', where_params=(), select='*'):
+    """Fetch one page of table in order as a DataFrame, plus the cursor of the page after it.
+
+    order is [(column, 'ASC'|'DESC'), ...]; rowid is added as tie-breaker so
+    the order is total. With a cursor the page starts after the cursor's row
+    (keyset paging, constant time with a matching index), otherwise at offset.
+    where optionally filters the rows and select (see formatted_select) picks
+    and formats the columns returned. The next cursor is None on the last page.
+    """
+    # Reversed sorts scan their index backwards, so rowid has to follow the first column's direction
+    key = [(f'"{table}"."{col}"', direction) for col, direction in order]
+    key.append((f'"{table}".rowid', order[0][1] if order else 'ASC'))
+    order_clause = ', '.join(f'{col} {direction}' for col, direction in key)
+    conditions = [f'({where})'] if where else []
+    params = list(where_params)
+    if cursor is not None:
+        predicate, cursor_params = keyset_predicate(key, cursor)
+        conditions.append(f'({predicate})')
+        params.extend(cursor_params)
+        offset = 0
+    where_clause = f' WHERE {" AND ".join(conditions)}' if conditions else ''
+    # The cursor needs the stored values of the sort columns, whatever select formats them as
+    key_columns = ', '.join(f'{col} AS "__key{i}"' for i, (col, _) in enumerate(key))
+    df = pd.read_sql_query(f'SELECT {key_columns}, {select} FROM "{table}"{where_clause} ORDER BY {order_clause} '
+                           f'LIMIT ? OFFSET ?', conn, params=params + [page_size + 1, offset])
+    key_names = [f'__key{i}' for i in range(len(key))]
+    next_cursor = None
+    if len(df) > page_size:
+        df = df.head(page_size)
+        last = df.iloc[-1]
+        # Plain Python values, so the cursor can be put in the URL as JSON
+        next_cursor = [None if pd.isna(last[col]) else last[col].item() if hasattr(last[col], 'item') else last[col]
+                       for col in key_names]
+    return df.drop(columns=key_names), next_cursor
+
+@app.route('/table_data/<path:db_file>/<table_name>', methods=['GET', 'POST'])
+def table_data(db_file, table_name):
+    """DataTables server-side processing: one page of rows as JSON, searched, ordered and paged by SQLite"""
+    args = request.values
+    draw = args.get('draw', 0, type=int)
+    if not os.path.exists(db_file):
+        return jsonify({'draw': draw, 'error': 'Database file not found.'}), 404
+
+    try:
+        conn = sqlite3.connect(db_file)
+        columns = [row[1] for row in conn.execute(f"PRAGMA table_info('{table_name}')")]
+        if not columns:
+            conn.close()
+            return jsonify({'draw': draw, 'error': f'Table {table_name} not found.'}), 404
+        metadata = get_column_metadata(conn, table_name)
+
+        # order[i][column] is the index of a column as listed by PRAGMA table_info
+        order = []
+        i = 0
+        while f'order[{i}][column]' in args:
+            index = args.get(f'order[{i}][column]', -1, type=int)
+            direction = 'DESC' if args.get(f'order[{i}][dir]', '').lower() == 'desc' else 'ASC'
+            if 0 <= index < len(columns) and columns[index] not in dict(order):
+                order.append((columns[index], direction))
+            i += 1
+
+        # Filters from view_table, then column searches matching their column as displayed
+        filters = request_filters(args, columns)
+        filter_where, filter_params, _ = compile_filters(table_name, filters, metadata)
+        conditions = [filter_where] if filter_where else []
+        params = list(filter_params)
+        for i, col in enumerate(columns):
+            value = args.get(f'columns[{i}][search][value]', '').strip()
+            if value:
+                condition, condition_params = search_condition(table_name, [col], metadata, value)
+                conditions.append(condition)
+                params.extend(condition_params)
+        column_where = ' AND '.join(f'({condition})' for condition in conditions)
+        column_params = list(params)
+
+        # The global search uses the full-text index when the table has one, else matches all columns as displayed
+        search = args.get('search[value]', '').strip()
+        match = fulltext_query(search) if search and fulltext_columns(conn, table_name) else None
+        if match:
+            conditions.append(fulltext_condition(table_name))
+            params.append(match)
+        elif search:
+            condition, condition_params = search_condition(table_name, columns, metadata, search)
+            conditions.append(condition)
+            params.extend(condition_params)
+        where = ' AND '.join(f'({condition})' for condition in conditions)
+
+        start = max(args.get('start', 0, type=int), 0)
+        length = args.get('length', VIEW_PAGE_SIZES[0], type=int)
+        if length <= 0 or length > max(VIEW_PAGE_SIZES):
+            # -1 asks for all rows, which is what this endpoint is meant to avoid
+            length = max(VIEW_PAGE_SIZES)
+        if start == 0:
+            # Count sort and filter requests, not every page scrolled through
+            if order:
+                record_sort(conn, db_file, table_name, order)
+            record_filter(conn, db_file, table_name, filters, metadata)
+
+        total_rows = table_row_count(conn, db_file, table_name)
+        filtered_rows = table_row_count(conn, db_file, table_name, where, params) if where else total_rows
+
+        # The page after one already served continues from its keyset cursor instead of an OFFSET scan
+        token = db_state_token(db_file)
+        cursor_key = (table_name, tuple(order), where, tuple(params))
+        with _page_cursor_cache_lock:
+            cursor = _page_cursor_cache.get((token,) + cursor_key + (start,)) if token else None
+        select = formatted_select(table_name, columns, metadata)
+        if match and not order:
+            # Full-text matches come best first unless a column order was asked for
+            df, next_cursor = cached_result(
+                db_file, table_name, ('ranked', match, column_where, tuple(column_params), start, length, select),
+                lambda: (fetch_ranked(conn, table_name, match, length, start, select,
+                                      column_where, column_params), None))
+        else:
+            df, next_cursor = cached_result(
+                db_file, table_name, ('data', tuple(order), where, tuple(params), start, length, select),
+                lambda: fetch_page(conn, table_name, order, length, cursor, start, where, params, select))
+        conn.close()
+        if next_cursor and token:
+            with _page_cursor_cache_lock:
+                _cache_for_token(_page_cursor_cache, token, cursor_key + (start + length,), next_cursor)
+
+        data = df.astype(object).where(df.notna(), '').values.tolist()
+        return jsonify({'draw': draw, 'recordsTotal': total_rows, 'recordsFiltered': filtered_rows, 'data': data})
+    except Exception as e:
+        return jsonify({'draw': draw, 'error': f'Error reading table {table_name}: {e}'}), 500
+
+@app.route('/search/<path:db_file>/<table_name>', methods=['GET'])
+def search_table(db_file, table_name):
+    """Ranked full-text search of a table as JSON: ?q=words&page=1&page_size=20"""
+    if not os.path.exists(db_file):
+        return jsonify({'error': 'Database file not found.'}), 404
+    query = fulltext_query(request.args.get('q', ''))
+    page_size = request.args.get('page_size', VIEW_PAGE_SIZES[0], type=int)
+    if page_size not in VIEW_PAGE_SIZES:
+        page_size = VIEW_PAGE_SIZES[0]
+    page = max(request.args.get('page', 1, type=int), 1)
+
+    try:
+        conn = sqlite3.connect(db_file)
+        if fulltext_columns(conn, table_name) is None:
+            conn.close()
+            return jsonify({'error': f'Table {table_name} has no full-text index.'}), 400
+        columns = [row[1] for row in conn.execute(f"PRAGMA table_info('{table_name}')")]
+        total = 0
+        rows = []
+        if query:
+            select = formatted_select(table_name, columns, get_column_metadata(conn, table_name))
+            total = table_row_count(conn, db_file, table_name, fulltext_condition(table_name), [query])
+            df = cached_result(db_file, table_name, ('ranked', query, '', (), (page - 1) * page_size, page_size, select),
+                               lambda: fetch_ranked(conn, table_name, query, page_size, (page - 1) * page_size, select))
+            rows = df.astype(object).where(df.notna(), None).values.tolist()
+        conn.close()
+        return jsonify({'query': request.args.get('q', ''), 'total': total, 'page': page, 'page_size': page_size,
+                        'columns': columns, 'rows': rows})
+    except Exception as e:
+        return jsonify({'error': f'Error searching table {table_name}: {e}'}), 500
+
+@app.route('/fulltext/<path:db_file>/<table_name>', methods=['POST'])
+def fulltext(db_file, table_name):
+    """Turn the full-text index of a table's TEXT columns on (or rebuild it) or off"""
+    if not os.path.exists(db_file):
+        return "Database file not found.", 404
+
+    try:
+        with get_db_write_lock(db_file):
+            conn = sqlite3.connect(db_file, timeout=SQLITE_TIMEOUT)
+            try:
+                if request.form.get('action') == 'disable':
+                    disable_fulltext(conn, table_name)
+                else:
+                    columns = text_columns(conn, table_name)
+                    if not columns:
+                        return f"Table {table_name} has no TEXT columns to search.", 400
+                    print(f"DEBUG: Building full-text index of {table_name} over {columns}")
+                    with conn:
+                        conn.execute('BEGIN IMMEDIATE')
+                        create_fulltext(conn, table_name, columns)
+            finally:
+                conn.close()
+        invalidate_result_cache(db_file, table_name)
+        return redirect(url_for('view_table', db_file=db_file, table_name=table_name))
+    except Exception as e:
+        return f"Error changing full-text search of table {table_name}: {e}", 500
+
+@app.route('/auto_indexes/<path:db_file>')
+def auto_indexes(db_file):
+    """Indexes created for popular view_table sorts, and the sorts requested since the app started"""
+    if not os.path.exists(db_file):
+        return "Database file not found.", 404
+    conn = sqlite3.connect(db_file)
+    try:
+        # Only read: creating the bookkeeping table here would write to the database and wait for imports
+        indexes = []
+        if conn.execute("SELECT 1 FROM sqlite_master WHERE type='table' AND name='auto_indexes'").fetchone():
+            indexes = conn.execute('''
+                SELECT index_name, table_name, columns, hits, created_at FROM auto_indexes ORDER BY created_at
+            ''').fetchall()
+    finally:
+        conn.close()
+    db_key = os.path.abspath(db_file)
+    with _sort_hits_lock:
+        hits = {(table, key): count for (db, table, key), count in _sort_hits.items() if db == db_key}
+        pending = {(table, key) for db, table, key in _auto_indexes_pending if db == db_key}
+    index_rows = []
+    for name, table, columns, created_hits, created_at in indexes:
+        key = tuple(tuple(part) for part in json.loads(columns))
+        index_rows.append({'name': name, 'table': table, 'columns': key, 'created_hits': created_hits,
+                           'hits': hits.pop((table, key), 0), 'created_at': created_at})
+    sort_rows = [{'table': table, 'columns': key, 'hits': count, 'pending': (table, key) in pending}
+                 for (table, key), count in sorted(hits.items(), key=lambda item: -item[1])]
+    return render_template_string(STYLE + '''
+    <div class="header"><img src="/static/Unknown.png" alt="LAB14 Logo" class="header-logo"><span class="header-title">Excel to SQLite Importer</span><nav class="menu"><a href="/" class="menu-link">Start Over</a><a href="/view_db" class="menu-link">View Database</a></nav></div>
+    <div class="container">
+    <h1>Sort Indexes: {{db_file}}</h1>
+    <p>Sorts requested {{threshold}} times get an index automatically, at most {{max_per_table}} per table.</p>
+    <h2>Automatic indexes</h2>
+    <table>
+        <thead><tr><th>Index</th><th>Table</th><th>Columns</th><th>Sorts when created</th><th>Sorts since start</th><th>Created</th></tr></thead>
+        <tbody>
+            {% for row in index_rows %}
+            <tr>
+                <td>{{row.name}}</td><td>{{row.table}}</td>
+                <td>{% for col, direction in row.columns %}{{col}} {{direction}}{% if not loop.last %}, {% endif %}{% endfor %}</td>
+                <td>{{row.created_hits}}</td><td>{{row.hits}}</td><td>{{row.created_at}}</td>
+            </tr>
+            {% else %}
+            <tr><td colspan="6">No automatic indexes yet.</td></tr>
+            {% endfor %}
+        </tbody>
+    </table>
+    <h2>Other sorts since start</h2>
+    <table>
+        <thead><tr><th>Table</th><th>Columns</th><th>Sorts</th><th>Status</th></tr></thead>
+        <tbody>
+            {% for row in sort_rows %}
+            <tr>
+                <td>{{row.table}}</td>
+                <td>{% for col, direction in row.columns %}{{col}} {{direction}}{% if not loop.last %}, {% endif %}{% endfor %}</td>
+                <td>{{row.hits}}</td>
+                <td>{% if row.pending %}Creating index{% elif row.hits >= threshold %}Indexed or over budget{% else %}Below threshold{% endif %}</td>
+            </tr>
+            {% else %}
+            <tr><td colspan="4">No other sorts requested.</td></tr>
+            {% endfor %}
+        </tbody>
+    </table>
+    </div>
+    ''', db_file=db_file, index_rows=index_rows, sort_rows=sort_rows,
+         threshold=AUTO_INDEX_THRESHOLD, max_per_table=AUTO_INDEX_MAX_PER_TABLE)
 
 @app.route('/edit_column/<path:db_file>/<table_name>/<column_name>', methods=['GET', 'POST'])
 def edit_column(db_file, table_name, column_name):
@@ -1068,8 +3262,19 @@ def edit_column(db_file, table_name, column_name):
                                       (new_column_name, table_name, column_name))
                     except Exception:
                         pass  # Metadata table might not exist
+                    try:
+                        cur.execute("UPDATE column_stats SET column_name = ? WHERE table_name = ? AND column_name = ?",
+                                    (new_column_name, table_name, column_name))
+                    except sqlite3.OperationalError:
+                        pass  # No statistics kept yet
+                    # The full-text index names its columns after the table's, so build it again
+                    indexed = fulltext_columns(conn, table_name)
+                    if indexed:
+                        create_fulltext(conn, table_name,
+                                        [new_column_name if col == column_name else col for col in indexed])
                     
                     conn.commit()
+                    invalidate_result_cache(db_file, table_name)
                     message = f"Column '{column_name}' successfully renamed to '{new_column_name}'."
                     
                     # Redirect back to view_db after successful rename
@@ -1140,8 +3345,109 @@ def edit_column(db_file, table_name, column_name):
     ''', db_file=db_file, table_name=table_name, column_name=column_name, 
          column_info=column_info, column_metadata=column_metadata, message=message)
 
+def hold_snapshot(path):
+    """Keep the cache limit from evicting a snapshot until release_snapshot"""
+    with _excel_cache_lock:
+        _snapshots_in_use[path] = _snapshots_in_use.get(path, 0) + 1
+
+def release_snapshot(path):
+    """Let the cache limit evict a snapshot again once nothing else holds it"""
+    with _excel_cache_lock:
+        if _snapshots_in_use.get(path, 0) > 1:
+            _snapshots_in_use[path] -= 1
+        else:
+            _snapshots_in_use.pop(path, None)
+
+def take_database_snapshot(db_path, path, prefix):
+    """Copy db_path to path with the backup API, replacing the older snapshots of the database (prefix)"""
+    # Snapshots of earlier versions of this database are no longer needed
+    for name in os.listdir(SNAPSHOT_DIR):
+        other = os.path.abspath(os.path.join(SNAPSHOT_DIR, name))
+        if name.startswith(prefix + '-') and other not in _snapshots_in_use:
+            try:
+                os.remove(other)
+            except OSError:
+                pass  # Still being downloaded (Windows)
+    # Make room first; a database larger than the limit leaves no room for anything else
+    enforce_excel_cache_limit(EXCEL_CACHE_MAX_BYTES - os.path.getsize(db_path))
+    print(f"DEBUG: Taking snapshot of {db_path}")
+    source = sqlite3.connect(db_path, timeout=SQLITE_TIMEOUT)
+    target = sqlite3.connect(path + '.tmp')
+    progress = {'remaining': None, 'restarts': 0}
+
+    def on_step(status, remaining, total):
+        # SQLite starts over when another connection writes between steps
+        if progress['remaining'] is not None and remaining > progress['remaining']:
+            progress['restarts'] += 1
+            if progress['restarts'] > BACKUP_MAX_RESTARTS:
+                raise InterruptedError('database keeps changing')
+        progress['remaining'] = remaining
+
+    try:
+        try:
+            source.backup(target, pages=BACKUP_PAGES_PER_STEP, progress=on_step)
+        except InterruptedError:
+            # Busy database: copy it in one step, writers wait for the read lock meanwhile
+            print(f"DEBUG: Snapshot of {db_path} restarted {progress['restarts']} times, copying in one step")
+            source.backup(target)
+        # A standalone file, whatever journal mode the live database uses
+        target.execute('PRAGMA journal_mode=DELETE')
+    finally:
+        target.close()
+        source.close()
+    os.replace(path + '.tmp', path)
+
+def database_snapshot(db_path, compress=False):
+    """Consistent copy of a database for download, made with SQLite's online backup API.
+
+    The copy is taken BACKUP_PAGES_PER_STEP pages at a time, so imports only
+    wait for one step. SQLite restarts it when another connection writes in
+    between; after BACKUP_MAX_RESTARTS restarts it is copied in one step.
+    Snapshots stay in SNAPSHOT_DIR until the database changes or the
+    excel cache limit evicts them, so an interrupted download can resume
+    with a Range request on the same file; the gzip variant is compressed
+    once from it. Returns (path, etag); the snapshot is held until the
+    caller passes path to release_snapshot.
+    """
+    # Taken before the copy, so a snapshot is never older than the state it is kept for
+    token = db_state_token(db_path)
+    prefix = hashlib.sha1(os.path.abspath(db_path).encode('utf-8')).hexdigest()[:12]
+    # Only commits count: a WAL checkpoint changes the file's size and mtime but not the data
+    inode, data_version = token[1][0], token[2]
+    etag = hashlib.sha1(repr((inode, data_version)).encode('utf-8')).hexdigest()[:16]
+    path = os.path.abspath(os.path.join(SNAPSHOT_DIR, f'{prefix}-{etag}.db'))
+    with _snapshot_lock:
+        os.makedirs(SNAPSHOT_DIR, exist_ok=True)
+        hold_snapshot(path)
+        if compress:
+            hold_snapshot(path + '.gz')
+        try:
+            if not os.path.exists(path):
+                take_database_snapshot(db_path, path, prefix)
+            if compress and not os.path.exists(path + '.gz'):
+                enforce_excel_cache_limit(EXCEL_CACHE_MAX_BYTES - os.path.getsize(path))
+                with open(path, 'rb') as src, gzip.open(path + '.gz.tmp', 'wb') as dst:
+                    shutil.copyfileobj(src, dst, 1024 * 1024)
+                os.replace(path + '.gz.tmp', path + '.gz')
+        except BaseException:
+            release_snapshot(path)
+            if compress:
+                release_snapshot(path + '.gz')
+            raise
+        if compress:
+            # Only the gzip variant is downloaded
+            release_snapshot(path)
+            path, etag = path + '.gz', etag + '-gz'
+        try:
+            # Mark it as recently used for the cache limit
+            os.utime(path)
+        except OSError:
+            pass
+    return path, etag
+
 @app.route('/export_db/<path:db_file>', methods=['GET'])
 def export_db(db_file):
+    """Download a consistent snapshot of a database, gzipped with ?gzip=1; Range requests resume downloads"""
     # URL decode the database file path
     import urllib.parse
     db_file = urllib.parse.unquote(db_file)
@@ -1154,69 +3460,118 @@ def export_db(db_file):
         if not os.access(db_file, os.R_OK):
             return "Database file is not readable.", 403
         
-        # Get file size to check if it's reasonable
-        file_size = os.path.getsize(db_file)
-        if file_size > 100 * 1024 * 1024:  # 100MB limit
-            return "Database file is too large to export.", 413
-        
-        with open(db_file, 'rb') as f:
-            return send_file(
-                f, 
-                as_attachment=True, 
-                download_name=os.path.basename(db_file),
-                mimetype='application/octet-stream'
+        compress = request.args.get('gzip') in ('1', 'true')
+        path, etag = database_snapshot(db_file, compress)
+        try:
+            response = send_file(
+                path,
+                as_attachment=True,
+                download_name=os.path.basename(db_file) + ('.gz' if compress else ''),
+                mimetype='application/gzip' if compress else 'application/octet-stream',
+                conditional=True,
+                etag=etag,
+                max_age=0
             )
+        except BaseException:
+            release_snapshot(path)
+            raise
+        # Evictable again once the download is over or aborted. send_file's response passes the file
+        # straight to the server, which closes the body but never calls response.call_on_close handlers
+        response.response = ClosingIterator(response.response, lambda: release_snapshot(path))
+        return response
     except PermissionError:
         return "Permission denied accessing database file.", 403
     except Exception as e:
         return f"Error exporting database: {str(e)}", 500
 
+def write_xlsx(cursor, path, metadata):
+    """Write a query's rows to an XLSX file with xlsxwriter in constant memory mode.
+
+    Rows go to disk as they are fetched; currency and date formats are set
+    once per column. Tables longer than EXCEL_MAX_ROWS continue on further
+    worksheets. Returns the number of rows written.
+    """
+    import xlsxwriter
+    columns = [column[0] for column in cursor.description]
+    workbook = xlsxwriter.Workbook(path, {'constant_memory': True})
+    try:
+        header_format = workbook.add_format({'bold': True})
+        column_formats = []
+        for col in columns:
+            info = metadata.get(col)
+            if info and info['is_currency']:
+                column_formats.append(workbook.add_format({'num_format': '$#,##0.00'}))
+            elif info and info['is_date']:
+                column_formats.append(workbook.add_format({'num_format': 'mm/dd/yyyy'}))
+            else:
+                column_formats.append(None)
+        worksheet = None
+        row_number = EXCEL_MAX_ROWS
+        written = 0
+        while True:
+            rows = cursor.fetchmany(EXPORT_CHUNK_SIZE)
+            if not rows and worksheet is not None:
+                break
+            for row in rows or [None]:
+                if row_number == EXCEL_MAX_ROWS:
+                    worksheet = workbook.add_worksheet()
+                    for idx, (col, fmt) in enumerate(zip(columns, column_formats)):
+                        worksheet.set_column(idx, idx, min(max(len(col), 10) + 2, 50), fmt)
+                    worksheet.write_row(0, 0, columns, header_format)
+                    worksheet.freeze_panes(1, 0)
+                    row_number = 0
+                if row is not None:
+                    row_number += 1
+                    worksheet.write_row(row_number, 0, row)
+                    written += 1
+    finally:
+        workbook.close()
+    return written
+
 @app.route('/export_table/<path:db_file>/<table_name>', methods=['GET'])
 def export_table(db_file, table_name):
+    """Export a table as XLSX with real currency and date cells, built in constant memory in a temporary file"""
     if not os.path.exists(db_file):
         return "Database file not found.", 404
     
+    path = None
     try:
         conn = sqlite3.connect(db_file)
-        metadata = get_column_metadata(conn, table_name)
-        df = pd.read_sql_query(f"SELECT * FROM {table_name}", conn)
-        conn.close()
-        
-        # Convert currency and date columns for export
-        for col in df.columns:
-            if col in metadata and metadata[col]['is_currency']:
-                df[col] = df[col] / 100
-                df[col] = df[col].round(2)
-            elif col in metadata and metadata[col]['is_date']:
-                df[col] = pd.to_datetime(df[col], errors='coerce').dt.strftime('%m/%d/%Y')
-        
-        output = io.BytesIO()
-        with pd.ExcelWriter(output, engine='openpyxl') as writer:
-            df.to_excel(writer, index=False)
-            workbook = writer.book
-            # Get the worksheet name - use a safe default name
-            worksheet_name = 'Sheet1'
-            worksheet = writer.sheets[worksheet_name]
-            # Apply currency format to currency columns
-            currency_fmt = None
-            try:
-                from openpyxl.styles import numbers
-                currency_fmt = numbers.FORMAT_CURRENCY_USD_SIMPLE
-            except ImportError:
-                currency_fmt = '$#,##0.00'
-            for idx, col in enumerate(df.columns):
-                if col in metadata and metadata[col]['is_currency']:
-                    col_letter = chr(ord('A') + idx)
-                    worksheet.column_dimensions[col_letter].number_format = currency_fmt
-                    for row in range(2, len(df) + 2):
-                        cell = worksheet[f'{col_letter}{row}']
-                        cell.number_format = currency_fmt
-        output.seek(0)
-        
-        return send_file(output, as_attachment=True, download_name=f"{table_name}.xlsx")
+        try:
+            metadata = get_column_metadata(conn, table_name)
+            columns = [row[1] for row in conn.execute(f"PRAGMA table_info('{table_name}')")]
+            if not columns:
+                return f"Table {table_name} not found.", 404
+            # Currency and date columns are converted for Excel by SQLite
+            cursor = conn.execute(f'SELECT {formatted_select(table_name, columns, metadata, "excel")} '
+                                  f'FROM "{table_name}"')
+            handle, path = tempfile.mkstemp(suffix='.xlsx')
+            os.close(handle)
+            rows = write_xlsx(cursor, path, metadata)
+        finally:
+            conn.close()
+        print(f"DEBUG: Exported {rows} rows of {table_name} to Excel")
     except Exception as e:
+        if path and os.path.exists(path):
+            os.remove(path)
         return f"Error exporting table {table_name}: {e}", 500
 
+    def generate():
+        # The temporary file goes away once it was sent, or the download was aborted
+        try:
+            with open(path, 'rb') as f:
+                while True:
+                    data = f.read(1024 * 1024)
+                    if not data:
+                        break
+                    yield data
+        finally:
+            os.remove(path)
+
+    return Response(generate(), mimetype='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
+                    headers={'Content-Disposition': attachment_header(f"{table_name}.xlsx"),
+                             'Content-Length': str(os.path.getsize(path))})
+
 @app.route('/delete_table/<path:db_file>/<table_name>', methods=['POST'])
 def delete_table(db_file, table_name):
     if not os.path.exists(db_file):
@@ -1227,7 +3582,9 @@ def delete_table(db_file, table_name):
         cur = conn.cursor()
         cur.execute(f"DROP TABLE IF EXISTS {table_name}")
         conn.commit()
+        forget_table(conn, table_name)
         conn.close()
+        invalidate_result_cache(db_file, table_name)
         return redirect(url_for('view_db'))
     except Exception as e:
         return f"Error deleting table {table_name}: {e}", 500
@@ -1243,23 +3600,50 @@ def view_table(db_file, table_name):
         # Get column metadata
         metadata = get_column_metadata(conn, table_name)
         
-        # Get data with optional sorting
+        # Get data with optional sorting, ignoring columns the table does not have
+        table_columns = [row[1] for row in conn.execute(f"PRAGMA table_info('{table_name}')")]
         sort_cols = request.args.getlist('sort')
         sort_orders = request.args.getlist('order')
-        order_clause = ""
-        if sort_cols:
-            order_parts = []
-            for i, col in enumerate(sort_cols):
-                direction = 'ASC'
-                if i < len(sort_orders) and sort_orders[i].upper() == 'DESC':
-                    direction = 'DESC'
-                order_parts.append(f'"{col}" {direction}')
-            order_clause = " ORDER BY " + ", ".join(order_parts)
-        
-        # Get data
-        df = pd.read_sql_query(f"SELECT * FROM {table_name}{order_clause}", conn)
+        order = []
+        for i, col in enumerate(sort_cols):
+            direction = 'ASC'
+            if i < len(sort_orders) and sort_orders[i].upper() == 'DESC':
+                direction = 'DESC'
+            if col in table_columns:
+                order.append((col, direction))
+        if order:
+            record_sort(conn, db_file, table_name, order)
+
+        # Filters are compiled to a parameterized WHERE clause on the stored values
+        filters = request_filters(request.args, table_columns)
+        where, where_params, filter_errors = compile_filters(table_name, filters, metadata)
+
+        # Only the requested page is read: keyset paging for "next", OFFSET for jumps to a page
+        page_size = request.args.get('page_size', VIEW_PAGE_SIZES[0], type=int)
+        if page_size not in VIEW_PAGE_SIZES:
+            page_size = VIEW_PAGE_SIZES[0]
+        page = max(request.args.get('page', 1, type=int), 1)
+        cursor = request.args.get('after')
+        try:
+            cursor = decode_cursor(cursor) if cursor else None
+        except ValueError:
+            cursor = None
+        if page == 1 and cursor is None:
+            record_filter(conn, db_file, table_name, filters, metadata)
+        total_rows = table_row_count(conn, db_file, table_name)
+        matching_rows = table_row_count(conn, db_file, table_name, where, where_params) if where else total_rows
+        fulltext = fulltext_columns(conn, table_name)
+        page_count = max((matching_rows + page_size - 1) // page_size, 1)
+        page = min(page, page_count)
+        select = formatted_select(table_name, table_columns, metadata)
+        offset = (page - 1) * page_size
+        page_key = ('page', tuple(order), where, tuple(where_params), tuple(cursor) if cursor else offset,
+                    page_size, select)
+        df, next_cursor = cached_result(
+            db_file, table_name, page_key,
+            lambda: fetch_page(conn, table_name, order, page_size, cursor, offset, where, where_params, select))
         conn.close()
-        
+
         # Debug: Check for problematic column names
         print(f"DEBUG: Table {table_name} columns:")
         for i, col in enumerate(df.columns):
@@ -1267,29 +3651,48 @@ def view_table(db_file, table_name):
             if not col or col.strip() == '':
                 print(f"    WARNING: Empty or whitespace-only column name at index {i}")
         
-        # Convert currency and date columns for display (with proper formatting for DataTables)
-        for col in df.columns:
-            if col in metadata and metadata[col]['is_currency']:
-                # Convert from pennies/cents back to dollars and format
-                # First ensure the column is numeric
-                df[col] = pd.to_numeric(df[col], errors='coerce')
-                df[col] = df[col] / 100
-                df[col] = df[col].round(2)
-                # Format as currency for display but keep numeric for sorting
-                df[col] = df[col].apply(lambda x: f"${x:.2f}" if pd.notna(x) and x != 0 else "")
-            elif col in metadata and metadata[col]['is_date']:
-                # Convert from ISO format to MM/DD/YYYY for display
-                df[col] = pd.to_datetime(df[col], errors='coerce').dt.strftime('%m/%d/%Y')
-
-        # Limit rows for display
-        show_all = request.args.get('show_all') == 'true'
-        if not show_all and len(df) > 20:
-            df_display = df.head(20)
-            has_more = True
-        else:
-            df_display = df
-            has_more = False
-        
+        # Empty cells for NULL, as table_data sends them for the following pages
+        df_display = df.astype(object).where(df.notna(), '')
+        first_row = (page - 1) * page_size + 1 if len(df) else 0
+        sort_args = {'sort': [col for col, _ in order], 'order': [direction.lower() for _, direction in order],
+                     **filter_args(filters)}
+
+        def page_url(**args):
+            return url_for('view_table', db_file=db_file, table_name=table_name, page_size=page_size,
+                           **sort_args, **args)
+
+        def sort_url(col):
+            # Clicking the current first sort column flips it, any other column sorts by it ascending
+            direction = 'desc' if order and order[0] == (col, 'ASC') else 'asc'
+            return url_for('view_table', db_file=db_file, table_name=table_name, page_size=page_size,
+                           sort=col, order=direction, **filter_args(filters))
+
+        pages = sorted({1, page_count} | set(range(max(page - 2, 1), min(page + 2, page_count) + 1)))
+        pagination = {
+            'first_row': first_row,
+            'last_row': first_row + len(df) - 1 if len(df) else 0,
+            'total_rows': total_rows,
+            'matching_rows': matching_rows,
+            'page': page,
+            'pages': [(p, page_url(page=p)) for p in pages],
+            'prev_url': page_url(page=page - 1) if page > 1 else None,
+            'next_url': page_url(page=page + 1, after=encode_cursor(next_cursor)) if next_cursor else None,
+            'page_sizes': [(size, url_for('view_table', db_file=db_file, table_name=table_name,
+                                          page_size=size, **sort_args)) for size in VIEW_PAGE_SIZES],
+            'page_size': page_size
+        }
+        sort_directions = dict(order)
+        # The page rendered here is the first page DataTables shows; later pages come from table_data
+        datatables = {
+            'url': url_for('table_data', db_file=db_file, table_name=table_name, **filter_args(filters)),
+            'order': [[list(df.columns).index(col), direction.lower()] for col, direction in order],
+            'display_start': first_row - 1 if first_row else 0,
+            'total_rows': total_rows,
+            'matching_rows': matching_rows
+        }
+        # The filters applied plus an empty row to add one
+        filter_rows = filters + [('', 'eq', '')]
+
         return render_template_string(STYLE + '''
         <link rel="stylesheet" type="text/css" href="https://cdn.datatables.net/1.13.7/css/jquery.dataTables.css">
         <script type="text/javascript" charset="utf8" src="https://code.jquery.com/jquery-3.7.1.min.js"></script>
@@ -1300,16 +3703,63 @@ def view_table(db_file, table_name):
         <div class="export-buttons">
             <a href="{{ url_for('export_table', db_file=db_file, table_name=table_name) }}">Export as Excel</a>
             <a href="{{ url_for('export_table_csv', db_file=db_file, table_name=table_name) }}">Export as CSV</a>
+            <a href="{{ url_for('export_table_csv', db_file=db_file, table_name=table_name, gzip=1) }}">Export as CSV (gzip)</a>
+            <a href="{{ url_for('export_table_parquet', db_file=db_file, table_name=table_name) }}">Export as Parquet</a>
+            <a href="{{ url_for('export_table_arrow', db_file=db_file, table_name=table_name) }}">Export as Arrow</a>
         </div>
-        {% if has_more %}
-        <p>Showing first 20 rows. <a href="?show_all=true">Show all rows</a></p>
-        {% endif %}
+        <form method="post" action="{{ url_for('fulltext', db_file=db_file, table_name=table_name) }}">
+            {% if fulltext %}
+            <p>Search uses the full-text index over {{ fulltext|join(', ') }}; matches are ranked best first.
+            <button type="submit" name="action" value="enable">Rebuild index</button>
+            <button type="submit" name="action" value="disable">Turn off full-text search</button></p>
+            {% else %}
+            <p>Search scans every row.
+            <button type="submit" name="action" value="enable">Index text columns for full-text search</button></p>
+            {% endif %}
+        </form>
+        <form method="get" action="{{ url_for('view_table', db_file=db_file, table_name=table_name) }}">
+            <strong>Filter</strong>
+            {% for col, op, value in filter_rows %}
+            <div>
+                <select name="fcol">
+                    <option value="">(column)</option>
+                    {% for name in df_display.columns %}<option value="{{name}}" {% if name == col %}selected{% endif %}>{{name}}</option>{% endfor %}
+                </select>
+                <select name="fop">
+                    {% for key, label in filter_operators.items() %}<option value="{{key}}" {% if key == op %}selected{% endif %}>{{label}}</option>{% endfor %}
+                </select>
+                <input type="text" name="fval" value="{{value}}" placeholder="e.g. Won, 50k, 07/01/2024">
+            </div>
+            {% endfor %}
+            {% for col, direction in sort_directions.items() %}
+            <input type="hidden" name="sort" value="{{col}}"><input type="hidden" name="order" value="{{direction|lower}}">
+            {% endfor %}
+            <input type="hidden" name="page_size" value="{{pagination.page_size}}">
+            <button type="submit">Apply filters</button>
+            {% if filter_rows|length > 1 %}<a href="{{ url_for('view_table', db_file=db_file, table_name=table_name, page_size=pagination.page_size) }}">Clear filters</a>{% endif %}
+            {% for error in filter_errors %}<p class="error">Ignored filter {{error}}</p>{% endfor %}
+        </form>
+        <p id="pager">
+            Rows {{pagination.first_row}}-{{pagination.last_row}} of {{pagination.matching_rows}}
+            {% if pagination.matching_rows != pagination.total_rows %}matching ({{pagination.total_rows}} in table){% endif %}
+            &nbsp;|&nbsp;
+            {% if pagination.prev_url %}<a href="{{pagination.prev_url}}">&laquo; Prev</a>{% endif %}
+            {% for p, url in pagination.pages %}
+                {% if loop.previtem is defined and p > loop.previtem[0] + 1 %}&hellip;{% endif %}
+                {% if p == pagination.page %}<strong>{{p}}</strong>{% else %}<a href="{{url}}">{{p}}</a>{% endif %}
+            {% endfor %}
+            {% if pagination.next_url %}<a href="{{pagination.next_url}}">Next &raquo;</a>{% endif %}
+            &nbsp;|&nbsp; Rows per page:
+            {% for size, url in pagination.page_sizes %}
+                {% if size == pagination.page_size %}<strong>{{size}}</strong>{% else %}<a href="{{url}}">{{size}}</a>{% endif %}
+            {% endfor %}
+        </p>
         <div style="overflow-x:auto; overflow-y:auto; max-height:70vh; border-radius:8px; box-shadow:0 2px 10px rgba(0,0,0,0.08); background:#fff;">
         <table id="dataTable" style="min-width:1200px; font-size:0.95rem; border-collapse:separate; border-spacing:0;">
             <thead style="position:sticky; top:0; background:#003d21; color:#fff; z-index:2;">
                 <tr>
                     {% for col in df_display.columns %}
-                    <th style="position:sticky; top:0; background:#003d21; color:#fff; padding:10px 8px; border-bottom:2px solid #ebebeb;">{{col}}</th>
+                    <th style="position:sticky; top:0; background:#003d21; color:#fff; padding:10px 8px; border-bottom:2px solid #ebebeb;"><a href="{{sort_url(col)}}" style="color:#fff;">{{col}}{% if col in sort_directions %}<span class="sort-marker"> {% if sort_directions[col] == 'ASC' %}&#9650;{% else %}&#9660;{% endif %}</span>{% endif %}</a></th>
                     {% endfor %}
                 </tr>
             </thead>
@@ -1326,84 +3776,254 @@ def view_table(db_file, table_name):
         </div>
         <script>
         $(document).ready(function() {
+            // DataTables takes over paging and sorting, the links are for browsers without JavaScript
+            $('#pager').hide();
+            $('#dataTable th .sort-marker').remove();
+            $('#dataTable th a').contents().unwrap();
             $('#dataTable').DataTable({
                 scrollX: true,
                 scrollY: '60vh',
                 scrollCollapse: true,
-                paging: false,
-                searching: false,
-                info: false,
-                ordering: true,
-                order: [],
+                // Paging, searching and sorting are done by SQLite through table_data
+                serverSide: true,
+                processing: true,
+                ajax: {url: {{ datatables.url|tojson }}, type: 'POST'},
+                deferLoading: [{{ datatables.matching_rows }}, {{ datatables.total_rows }}],
+                displayStart: {{ datatables.display_start }},
+                pageLength: {{ pagination.page_size }},
+                lengthMenu: {{ pagination.page_sizes|map('first')|list|tojson }},
+                searchDelay: 400,
+                order: {{ datatables.order|tojson }},
                 columnDefs: [
                     {
                         targets: '_all',
-                        className: 'dt-body-center',
-                        render: function(data, type, row, meta) {
-                            if (type === 'display') {
-                                return data;
-                            }
-                            if (type === 'sort') {
-                                // Remove $ and convert to number for sorting
-                                if (typeof data === 'string' && data.startsWith('$')) {
-                                    return parseFloat(data.replace('$', '').replace(',', '')) || 0;
-                                }
-                                return data;
-                            }
-                            return data;
-                        }
+                        className: 'dt-body-center'
                     }
                 ]
             });
         });
         </script>
-        ''', table_name=table_name, df_display=df_display, has_more=has_more, db_file=db_file)
+        ''', table_name=table_name, df_display=df_display, db_file=db_file, pagination=pagination,
+             sort_url=sort_url, sort_directions=sort_directions, datatables=datatables,
+             fulltext=fulltext, filter_rows=filter_rows, filter_operators=FILTER_OPERATORS,
+             filter_errors=filter_errors)
         
     except Exception as e:
         return f"Error viewing table {table_name}: {e}", 500
 
+def attachment_header(filename):
+    """Content-Disposition header value for a download, also for non-ASCII file names"""
+    fallback = secure_filename(filename) or 'export'
+    return f"attachment; filename=\"{fallback}\"; filename*=UTF-8''{urllib.parse.quote(filename)}"
+
+def iter_csv(cursor, compress=False):
+    """Yield a query's rows as encoded CSV, header first, a chunk of rows at a time, optionally gzipped"""
+    compressor = zlib.compressobj(wbits=31) if compress else None
+    buffer = io.StringIO()
+    writer = csv.writer(buffer, lineterminator='\n')
+    writer.writerow([column[0] for column in cursor.description])
+    while True:
+        rows = cursor.fetchmany(EXPORT_CHUNK_SIZE)
+        writer.writerows(rows)
+        data = buffer.getvalue().encode('utf-8')
+        buffer.seek(0)
+        buffer.truncate()
+        if compressor:
+            data = compressor.compress(data)
+        if data:
+            yield data
+        if not rows:
+            break
+    if compressor:
+        yield compressor.flush()
+
 @app.route('/export_table_csv/<path:db_file>/<table_name>', methods=['GET'])
 def export_table_csv(db_file, table_name):
+    """Stream a table as CSV (gzipped with ?gzip=1), converting currency and dates in SQLite as rows are read"""
     if not os.path.exists(db_file):
         return "Database file not found.", 404
+    compress = request.args.get('gzip') in ('1', 'true')
     
     try:
         conn = sqlite3.connect(db_file)
-        
-        # Get column metadata
         metadata = get_column_metadata(conn, table_name)
-        
-        # Get data
-        df = pd.read_sql_query(f"SELECT * FROM {table_name}", conn)
-        conn.close()
-        
-        # Convert currency and date columns for export
-        for col in df.columns:
-            if col in metadata and metadata[col]['is_currency']:
-                # Convert from pennies/cents back to dollars
-                df[col] = df[col] / 100
-                df[col] = df[col].round(2)
-            elif col in metadata and metadata[col]['is_date']:
-                # Convert from ISO format to MM/DD/YYYY
-                df[col] = pd.to_datetime(df[col], errors='coerce').dt.strftime('%m/%d/%Y')
-        
-        output = io.StringIO()
-        df.to_csv(output, index=False)
-        output.seek(0)
-        
-        return send_file(
-            io.BytesIO(output.getvalue().encode('utf-8')),
-            as_attachment=True,
-            download_name=f"{table_name}.csv",
-            mimetype='text/csv'
-        )
+        columns = [row[1] for row in conn.execute(f"PRAGMA table_info('{table_name}')")]
+        if not columns:
+            conn.close()
+            return f"Table {table_name} not found.", 404
+        cursor = conn.execute(f'SELECT {formatted_select(table_name, columns, metadata, "export")} '
+                              f'FROM "{table_name}"')
+    except Exception as e:
+        return f"Error exporting table {table_name}: {e}", 500
+
+    def generate():
+        # Memory stays at one chunk of rows however large the table is
+        try:
+            yield from iter_csv(cursor, compress)
+        finally:
+            conn.close()
+
+    filename = f"{table_name}.csv" + ('.gz' if compress else '')
+    return Response(stream_with_context(generate()),
+                    mimetype='application/gzip' if compress else 'text/csv',
+                    headers={'Content-Disposition': attachment_header(filename)})
+
+def arrow_columns(conn, table, columns, metadata):
+    """Arrow schema for exporting columns of table, and the SELECT list producing values of those types.
+
+    Currency becomes dollars as float64 and dates timestamps, sent by SQLite
+    as seconds since the epoch. Other columns get the type of the values
+    they actually hold, found in one scan: integers int64, numbers float64,
+    anything mixed with text a string.
+    """
+    import pyarrow as pa
+    declared = {row[1]: (row[2] or '').upper() for row in conn.execute(f"PRAGMA table_info('{table}')")}
+    plain = [col for col in columns
+             if not (metadata.get(col) and (metadata[col]['is_currency'] or metadata[col]['is_date']))]
+    storage = {}
+    if plain:
+        probes = ', '.join(f'group_concat(DISTINCT typeof("{table}"."{col}"))' for col in plain)
+        found = conn.execute(f'SELECT {probes} FROM "{table}"').fetchone()
+        storage = {col: set((classes or '').split(',')) - {'', 'null'} for col, classes in zip(plain, found)}
+    fields = []
+    select = []
+    for col in columns:
+        info = metadata.get(col)
+        column = f'"{table}"."{col}"'
+        if info and info['is_currency']:
+            fields.append(pa.field(col, pa.float64()))
+            select.append(formatted_column_sql(table, col, info, 'export'))
+            continue
+        if info and info['is_date']:
+            fields.append(pa.field(col, pa.timestamp('s')))
+            select.append(f"CAST(strftime('%s', {column}) AS INTEGER) AS \"{col}\"")
+            continue
+        classes = storage[col] or {'integer' if 'INT' in declared.get(col, '') else
+                                   'real' if declared.get(col) in ('REAL', 'FLOAT', 'DOUBLE', 'NUMERIC') else 'text'}
+        if classes == {'integer'}:
+            fields.append(pa.field(col, pa.int64()))
+        elif classes <= {'integer', 'real'}:
+            fields.append(pa.field(col, pa.float64()))
+        else:
+            fields.append(pa.field(col, pa.string()))
+            column = f'CAST({column} AS TEXT)'
+        select.append(f'{column} AS "{col}"')
+    return pa.schema(fields), ', '.join(select)
+
+class ExportSink:
+    """Write-only file object collecting what a pyarrow writer writes, to be sent as it is produced"""
+
+    closed = False
+
+    def __init__(self):
+        self.parts = []
+        self.position = 0
+
+    def write(self, data):
+        self.parts.append(bytes(data))
+        self.position += len(data)
+        return len(data)
+
+    def tell(self):
+        # Parquet records the offsets of row groups in its footer
+        return self.position
+
+    def flush(self):
+        pass
+
+    def take(self):
+        """Bytes written since the last call"""
+        data = b''.join(self.parts)
+        self.parts = []
+        return data
+
+def iter_arrow(cursor, schema, file_format):
+    """Yield a query's rows as a Parquet file or an Arrow IPC stream, EXPORT_CHUNK_SIZE rows per record batch"""
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+    sink = ExportSink()
+    if file_format == 'parquet':
+        writer = pq.ParquetWriter(sink, schema)
+    else:
+        writer = pa.ipc.new_stream(sink, schema)
+    pending = []
+    pending_rows = 0
+    try:
+        while True:
+            rows = cursor.fetchmany(EXPORT_CHUNK_SIZE)
+            if rows:
+                values = list(zip(*rows))
+                batch = pa.RecordBatch.from_arrays(
+                    [pa.array(column, type=field.type) for column, field in zip(values, schema)], schema=schema)
+                if file_format == 'parquet':
+                    # Row groups of a few thousand rows would make the file slow to read
+                    pending.append(batch)
+                    pending_rows += len(batch)
+                else:
+                    writer.write_batch(batch)
+            if pending and (pending_rows >= PARQUET_ROW_GROUP_ROWS or not rows):
+                writer.write_table(pa.Table.from_batches(pending, schema), row_group_size=pending_rows)
+                pending = []
+                pending_rows = 0
+            if not rows:
+                break
+            data = sink.take()
+            if data:
+                yield data
+    finally:
+        writer.close()
+    yield sink.take()
+
+def export_table_columnar(db_file, table_name, file_format):
+    """Stream a table as Parquet or Arrow IPC with typed columns; needs the optional pyarrow package"""
+    if not os.path.exists(db_file):
+        return "Database file not found.", 404
+    try:
+        import pyarrow
+    except ImportError:
+        return "Parquet and Arrow exports need pyarrow, install it with: pip install pyarrow", 501
+
+    try:
+        conn = sqlite3.connect(db_file)
+        metadata = get_column_metadata(conn, table_name)
+        columns = [row[1] for row in conn.execute(f"PRAGMA table_info('{table_name}')")]
+        if not columns:
+            conn.close()
+            return f"Table {table_name} not found.", 404
+        schema, select = arrow_columns(conn, table_name, columns, metadata)
+        cursor = conn.execute(f'SELECT {select} FROM "{table_name}"')
     except Exception as e:
         return f"Error exporting table {table_name}: {e}", 500
 
+    def generate():
+        try:
+            yield from iter_arrow(cursor, schema, file_format)
+        finally:
+            conn.close()
+
+    if file_format == 'parquet':
+        filename, mimetype = f"{table_name}.parquet", 'application/vnd.apache.parquet'
+    else:
+        filename, mimetype = f"{table_name}.arrows", 'application/vnd.apache.arrow.stream'
+    return Response(stream_with_context(generate()), mimetype=mimetype,
+                    headers={'Content-Disposition': attachment_header(filename)})
+
+@app.route('/export_table_parquet/<path:db_file>/<table_name>', methods=['GET'])
+def export_table_parquet(db_file, table_name):
+    """Stream a table as a Parquet file"""
+    return export_table_columnar(db_file, table_name, 'parquet')
+
+@app.route('/export_table_arrow/<path:db_file>/<table_name>', methods=['GET'])
+def export_table_arrow(db_file, table_name):
+    """Stream a table in the Arrow IPC streaming format, read with pyarrow.ipc.open_stream"""
+    return export_table_columnar(db_file, table_name, 'arrow')
+
 @app.route('/static/<path:filename>')
 def static_files(filename):
     return send_from_directory('static', filename)
 
 if __name__ == '__main__':
+    # Needed for the sheet parsing process pool in frozen (PyInstaller) builds
+    multiprocessing.freeze_support()
     # Set to '0.0.0.0' for network access, '127.0.0.1' for local only
-    app.run(host='127.0.0.1', port=5666, debug=True) 
\ No newline at end of file
+    app.run(host='127.0.0.1', port=5666, debug=True, threaded=True) 
\ No newline at end of file